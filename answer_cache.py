@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Semantic Answer Cache
+
+Answer cache in front of the graph that also matches paraphrases ("AAPL
+price?" / "what is apple trading at"). Questions are turned into sparse
+vectors locally (hashed words plus character trigrams, no embedding service)
+and compared by cosine similarity against recent answers with the same scope
+(session or shared) and the same tickers.
+
+Freshness depends on the kind of question:
+- live      - prices, quotes, "today"/"now": a few seconds of staleness only
+- market    - other questions that needed a search (news, analysis)
+- concept   - no search needed (definitions, general explanations). These are
+  answered from the session's conversation history, which changes with every
+  turn, so the service leaves them uncached unless a TTL is configured
+- follow-up questions about the conversation itself are never cached
+
+The cache is bounded by an estimate of its memory use; least recently used
+answers are evicted first. With a `path`, answers are also written to a
+SQLite table that other worker processes look in when their own memory misses.
+"""
+
+import asyncio
+import json
+import math
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import shared_db
+from search_classifier import FOLLOW_UP_RE
+from search_cache import normalize_question
+from symbols import FILLER_WORDS
+
+LIVE_RE = re.compile(
+    r"\b(price[sd]?|quote[sd]?|trading|traded|worth|cost|today|now|right now|current(ly)?|live|"
+    r"real ?time|intraday|opening|closing|premarket|after ?hours)\b"
+)
+
+# Words folded into one feature so common paraphrases land on the same vector
+SYNONYMS = {
+    "trading": "price", "traded": "price", "quote": "price", "quoted": "price", "worth": "price",
+    "cost": "price", "costs": "price", "priced": "price", "prices": "price", "valued": "price",
+    "purchase": "buy", "buying": "buy", "selling": "sell", "invest": "buy", "investing": "buy",
+    "versus": "vs", "compare": "vs", "comparison": "vs", "against": "vs",
+    "outlook": "forecast", "prediction": "forecast", "predictions": "forecast", "forecasts": "forecast",
+    "headlines": "news", "updates": "news", "latest": "news", "recent": "news",
+    "earnings": "eps",
+}
+# How the question is asked, not what about
+QUESTION_WORDS = frozenset("explain define definition mean meaning means please".split())
+
+_WORD_RE = re.compile(r"\$?[a-z0-9&]+")
+_PE_RE = re.compile(r"\bp\s*/?\s*e\b")
+_TRIGRAM_WEIGHT = 0.3
+
+
+def question_kind(question: str, needs_search: bool) -> str:
+    """live / market / concept / follow_up - decides how long an answer stays fresh"""
+    text = normalize_question(question)
+    if FOLLOW_UP_RE.search(text):
+        return "follow_up"
+    if not needs_search:
+        return "concept"
+    return "live" if LIVE_RE.search(text) else "market"
+
+
+def vectorize(text: str, dims: int = 1 << 20) -> dict:
+    """L2-normalized sparse vector of hashed words and character trigrams (tickers excluded)"""
+    vector = {}
+    for word in _WORD_RE.findall(_PE_RE.sub("pe", text.lower())):
+        if word.startswith("$") or word in FILLER_WORDS or word in QUESTION_WORDS:
+            continue
+        word = SYNONYMS.get(word, word)
+        features = [(word, 1.0)]
+        padded = f"#{word}#"
+        features += [(padded[i:i + 3], _TRIGRAM_WEIGHT) for i in range(len(padded) - 2)]
+        for feature, weight in features:
+            index = zlib.crc32(feature.encode()) % dims
+            vector[index] = vector.get(index, 0.0) + weight
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {k: v / norm for k, v in vector.items()} if norm else {}
+
+
+def cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class _Entry:
+    __slots__ = ("group", "text", "vector", "value", "kind", "expires_at", "size")
+
+    def __init__(self, group, text, vector, value, kind, expires_at):
+        self.group = group
+        self.text = text
+        self.vector = vector
+        self.value = value
+        self.kind = kind
+        self.expires_at = expires_at
+        # Rough footprint: strings in the cached response plus ~100 bytes per vector component
+        self.size = 512 + len(text) + 100 * len(vector) + sum(len(str(v)) for v in value.values())
+
+
+class SemanticAnswerCache:
+    """Near-duplicate question -> answer cache with per-kind TTLs and a memory budget"""
+
+    def __init__(self, ttls: dict, max_bytes: int = 32 * 1024 * 1024, threshold: float = 0.85, path: str = None):
+        """ttls: kind -> seconds (0 disables caching for that kind); path: optional shared SQLite tier"""
+        self.ttls = ttls
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self._entries = OrderedDict()  # (group, text) -> _Entry, least recently used first
+        self._groups = {}  # (scope, tickers) -> {text: _Entry}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stores = {}
+
+        self._db = None
+        if path:
+            self._db = shared_db.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answer_cache (scope TEXT NOT NULL, tickers TEXT NOT NULL, "
+                "text TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (scope, tickers, text))"
+            )
+
+    @staticmethod
+    def _group(scope: str, tickers) -> tuple:
+        return scope, tuple(sorted(set(tickers or ())))
+
+    def get(self, scope: str, text: str, tickers=()):
+        """Cached response for `text` or its closest fresh paraphrase above the threshold"""
+        group = self._group(scope, tickers)
+        now = time.time()
+        with self._lock:
+            candidates = self._groups.get(group, {})
+            best, best_score = candidates.get(text), 1.0
+            if best is None or best.expires_at <= now:
+                best, best_score = None, self.threshold
+                vector = vectorize(text)
+                for entry in list(candidates.values()):
+                    if entry.expires_at <= now:
+                        self._drop(entry)
+                        continue
+                    score = cosine(vector, entry.vector)
+                    if score >= best_score:
+                        best, best_score = entry, score
+            if best is None and self._db is not None:
+                best = self._load(group, text, vector, now)
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((group, best.text))
+            self.hits += 1
+            if best.text != text:
+                self.semantic_hits += 1
+            return best.value
+
+    def set(self, scope: str, text: str, tickers, value: dict, kind: str) -> None:
+        ttl = self.ttls.get(kind, 0)
+        if ttl <= 0:
+            return
+        group = self._group(scope, tickers)
+        entry = _Entry(group, text, vectorize(text), value, kind, time.time() + ttl)
+        with self._lock:
+            previous = self._entries.get((group, text))
+            if previous is not None:
+                self._drop(previous)
+            self._remember(entry)
+            self.stores[kind] = self.stores.get(kind, 0) + 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answer_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (scope, ",".join(group[1]), text, kind, json.dumps(value), entry.expires_at),
+                )
+                self._db.execute("DELETE FROM answer_cache WHERE expires_at <= ?", (time.time(),))
+
+    async def aget(self, scope: str, text: str, tickers=()):
+        """get() for coroutines - the SQLite tier is read on a worker thread, off the event loop"""
+        if self._db is None:
+            return self.get(scope, text, tickers)
+        return await asyncio.to_thread(self.get, scope, text, tickers)
+
+    async def aset(self, scope: str, text: str, tickers, value: dict, kind: str) -> None:
+        if self._db is None:
+            self.set(scope, text, tickers, value, kind)
+        else:
+            await asyncio.to_thread(self.set, scope, text, tickers, value, kind)
+
+    def _remember(self, entry) -> None:
+        self._entries[(entry.group, entry.text)] = entry
+        self._groups.setdefault(entry.group, {})[entry.text] = entry
+        self.bytes += entry.size
+        while self.bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries.values())))
+            self.evictions += 1
+
+    def _load(self, group, text, vector, now):
+        """Best match among answers other workers stored for the group (memory has none)"""
+        best, best_score = None, self.threshold
+        rows = self._db.execute(
+            "SELECT text, kind, value, expires_at FROM answer_cache WHERE scope = ? AND tickers = ? AND expires_at > ?",
+            (group[0], ",".join(group[1]), now),
+        ).fetchall()
+        for stored_text, kind, value, expires_at in rows:
+            stored_vector = vector if stored_text == text else vectorize(stored_text)
+            score = 1.0 if stored_text == text else cosine(vector, stored_vector)
+            if score >= best_score:
+                best, best_score = (stored_text, stored_vector, kind, value, expires_at), score
+        if best is None:
+            return None
+        stored_text, stored_vector, kind, value, expires_at = best
+        entry = _Entry(group, stored_text, stored_vector, json.loads(value), kind, expires_at)
+        self._remember(entry)
+        self.disk_hits += 1
+        return entry
+
+    def _drop(self, entry) -> None:
+        del self._entries[(entry.group, entry.text)]
+        group = self._groups[entry.group]
+        del group[entry.text]
+        if not group:
+            del self._groups[entry.group]
+        self.bytes -= entry.size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "stores": dict(self.stores),
+            "ttl_seconds": dict(self.ttls),
+            "similarity_threshold": self.threshold,
+        }
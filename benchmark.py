@@ -0,0 +1,266 @@
+"""
+Offline load test for the Stock Research API
+
+Runs the real graph and FastAPI app in-process with deterministic stand-ins
+for Gemini, Tavily and Wikipedia (configurable latency and token rate), drives
+concurrent /analyze/stream sessions and reports throughput, latency and
+time-to-first-token percentiles and memory growth per session. No network and
+no API keys are needed.
+
+    python benchmark.py --sessions 50 --questions 4
+    python benchmark.py --llm-tokens-per-sec 80 --search-ms 1200 --json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import time
+import zlib
+
+# Measure the app, not the providers' quotas - unless the caller configured limits explicitly
+for _provider in ("GEMINI", "TAVILY", "WIKIPEDIA"):
+    os.environ.setdefault(f"{_provider}_RATE_LIMIT", "0")
+os.environ.setdefault("WIKI_CACHE_PATH", "")
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+QUESTIONS = [
+    "What's the current price of Apple stock?",
+    "Should I buy Tesla stock now?",
+    "Compare NVIDIA vs AMD stocks",
+    "MSFT earnings outlook",
+    "Latest news on Amazon",
+    "Is Meta overvalued?",
+    "Hello, how are you?",
+    "thanks",
+    "What did I just ask about?",
+    "Explain the P/E ratio",
+]
+
+
+class FakeGemini(BaseChatModel):
+    """Deterministic chat model: waits first_token_ms, then streams answer_tokens at tokens_per_sec"""
+
+    first_token_ms: float = 300
+    tokens_per_sec: float = 150
+    answer_tokens: int = 200
+    classifier_ms: float = 150
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _answer(self, messages) -> list:
+        words = [f"word{i} " for i in range(self.answer_tokens - 1)]
+        return words + ["as reported [", "1]."]  # citation split across chunks, like real streams
+
+    def _usage(self, messages, tokens) -> dict:
+        prompt = sum(len(str(m.content)) for m in messages) // 4 + 1
+        return {"input_tokens": prompt, "output_tokens": tokens, "total_tokens": prompt + tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_ms / 1000 + self.answer_tokens / self.tokens_per_sec)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self._answer(messages))))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._answer(messages)
+        await asyncio.sleep(self.first_token_ms / 1000)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_sec)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, len(tokens))))
+
+    def with_structured_output(self, schema, **kwargs):
+        async def decide(messages):
+            await asyncio.sleep(self.classifier_ms / 1000)
+            return schema(needs_search=True)
+        return RunnableLambda(decide)
+
+
+class FakeTavily:
+    def __init__(self, latency_ms: float, results: int = 6, doc_chars: int = 800):
+        self.latency_ms = latency_ms
+        self.results = results
+        self.doc_chars = doc_chars
+
+    async def ainvoke(self, query):
+        await asyncio.sleep(self.latency_ms / 1000)
+        body = (f"Market update for {query[:60]}. " * 40)[:self.doc_chars]
+        return [{"url": f"https://news.example.com/{zlib.crc32(query.encode()) % 1000}/{i}", "content": body}
+                for i in range(self.results)]
+
+
+class FakeWikipedia:
+    def __init__(self, latency_ms: float, doc_chars: int = 4000):
+        self.latency_ms = latency_ms
+        self.doc_chars = doc_chars
+
+    def load(self, query, max_docs=6):
+        time.sleep(self.latency_ms / 1000)  # blocking like the real client - runs in a worker thread
+        return [
+            Document(
+                page_content=(f"{query} is a company. " * 300)[:self.doc_chars],
+                metadata={"title": f"{query} {i}", "source": f"https://en.wikipedia.org/wiki/{query.replace(' ', '_')}_{i}"},
+            )
+            for i in range(max_docs)
+        ]
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def stream_request(app, payload: dict) -> dict:
+    """POST /analyze/stream straight into the ASGI app and time the response"""
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/analyze/stream", "raw_path": b"/analyze/stream", "query_string": b"",
+        "root_path": "", "client": ("127.0.0.1", 0), "server": ("benchmark", 80),
+        "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())],
+    }
+    finished = asyncio.Event()
+    request_sent = False
+    result = {"status": None, "ttft": None, "bytes": 0, "error": False}
+    started = time.perf_counter()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            result["bytes"] += len(chunk)
+            if result["ttft"] is None and b'"type": "content"' in chunk:
+                result["ttft"] = time.perf_counter() - started
+            if b'"type": "error"' in chunk:
+                result["error"] = True
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    result["latency"] = time.perf_counter() - started
+    return result
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+async def run_load(api, args) -> dict:
+    rng = random.Random(args.seed)
+    plans = [[rng.choice(QUESTIONS) for _ in range(args.questions)] for _ in range(args.sessions)]
+    results = []
+
+    async def session(index, questions):
+        session_id = f"bench-{index}"
+        for question in questions:
+            if args.unique:
+                question = f"{question} #{index}"
+            results.append(await stream_request(api.app, {"question": question, "session_id": session_id}))
+
+    for i in range(args.warmup):
+        await stream_request(api.app, {"question": QUESTIONS[i % len(QUESTIONS)], "session_id": f"warmup-{i}"})
+    for i in range(args.warmup):
+        api.memory.delete_thread(f"warmup-{i}")
+
+    gc.collect()
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i, plan) for i, plan in enumerate(plans)))
+    wall = time.perf_counter() - started
+    gc.collect()
+    rss_after = rss_bytes()
+
+    ok = [r for r in results if r["status"] == 200 and not r["error"]]
+    return {
+        "sessions": args.sessions,
+        "requests": len(results),
+        "failed": len(results) - len(ok),
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency_ms": percentiles([r["latency"] for r in ok]),
+        "ttft_ms": percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "rss_growth_mb": round((rss_after - rss_before) / 1024 / 1024, 2),
+        "rss_growth_kb_per_session": round((rss_after - rss_before) / 1024 / args.sessions, 1),
+        "stored_sessions": api.memory.stats()["threads"],
+        "model_calls": {tier: stats["calls"] for tier, stats in api.model_router.stats()["tiers"].items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline /analyze/stream load test with fake providers")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent client sessions")
+    parser.add_argument("--questions", type=int, default=3, help="sequential questions per session")
+    parser.add_argument("--unique", action="store_true", help="make every question unique (no cache or coalescing hits)")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured requests before the run")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=150)
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    parser.add_argument("--classifier-ms", type=float, default=150)
+    parser.add_argument("--search-ms", type=float, default=800, help="fake Tavily latency")
+    parser.add_argument("--wiki-ms", type=float, default=400, help="fake Wikipedia latency")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    import fastapi_research as api
+
+    llm = FakeGemini(
+        first_token_ms=args.llm_first_token_ms, tokens_per_sec=args.llm_tokens_per_sec,
+        answer_tokens=args.answer_tokens, classifier_ms=args.classifier_ms,
+    )
+    tavily = FakeTavily(args.search_ms)
+    api.get_llm = lambda tier=api.PRO: llm
+    api.get_tavily_search = lambda: tavily
+    api.wikipedia_client = FakeWikipedia(args.wiki_ms)
+
+    report = asyncio.run(run_load(api, args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print("📈 Offline benchmark - /analyze/stream")
+    print("=" * 50)
+    print(f"Sessions x questions : {args.sessions} x {args.questions} ({report['requests']} requests, {report['failed']} failed)")
+    print(f"Wall time            : {report['wall_seconds']} s")
+    print(f"Throughput           : {report['throughput_rps']} req/s")
+    print(f"Latency p50/p95/p99  : {report['latency_ms']['p50']} / {report['latency_ms']['p95']} / {report['latency_ms']['p99']} ms")
+    print(f"TTFT p50/p95/p99     : {report['ttft_ms']['p50']} / {report['ttft_ms']['p95']} / {report['ttft_ms']['p99']} ms")
+    print(f"RSS growth           : {report['rss_growth_mb']} MB ({report['rss_growth_kb_per_session']} KB/session, "
+          f"{report['stored_sessions']} sessions stored)")
+    print(f"Model calls by tier  : {', '.join(f'{tier} {calls}' for tier, calls in report['model_calls'].items())}")
+
+
+if __name__ == "__main__":
+    main()
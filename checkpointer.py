@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded Checkpoint Storage
+
+MemorySaver keeps every checkpoint of every thread forever. BoundedMemorySaver
+keeps the same in-memory layout but caps:
+- how many conversation threads are held (least recently used evicted first)
+- how long an idle thread is kept
+- how many checkpoints each thread keeps (only the latest ones are ever read)
+
+SqliteCheckpointSaver applies the same limits to a SQLite file that several
+worker processes share (see shared_db.py), so sessions survive restarts and
+don't need sticky routing. Writes are incremental: channel values are stored
+once per channel version, and a checkpoint only writes the channels that
+changed in that step - a growing message list is not rewritten when only the
+search decision or context changes.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.types import TASKS
+
+import shared_db
+
+
+class BoundedMemorySaver(MemorySaver):
+    """MemorySaver with LRU/TTL thread eviction and per-thread checkpoint trimming"""
+
+    def __init__(self, *, max_threads: int = 1000, max_checkpoints_per_thread: int = 5,
+                 idle_ttl: float = 3600, serde=None):
+        super().__init__(serde=serde)
+        self.max_threads = max_threads
+        # the latest checkpoint reads pending sends from its parent - always keep two
+        self.max_checkpoints_per_thread = max(2, max_checkpoints_per_thread)
+        self.idle_ttl = idle_ttl
+        self.evicted_threads = 0
+        self._last_used = OrderedDict()  # thread_id -> last access time
+        self._lock = threading.RLock()
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            result = super().get_tuple(config)
+            if thread_id in self._last_used:
+                self._touch(thread_id)
+            elif not any(self.storage.get(thread_id, {}).values()):
+                self.storage.pop(thread_id, None)  # lookup of an unknown thread - don't keep the empty entry
+        return result
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            self._trim(thread_id)
+            self._touch(thread_id)
+            self._evict()
+        return next_config
+
+    def put_writes(self, config, writes, task_id):
+        with self._lock:
+            super().put_writes(config, writes, task_id)
+
+    def _touch(self, thread_id):
+        self._last_used[thread_id] = time.monotonic()
+        self._last_used.move_to_end(thread_id)
+
+    def _trim(self, thread_id):
+        """Drop all but the newest checkpoints of a thread (checkpoint ids sort by time)"""
+        for checkpoint_ns, checkpoints in self.storage[thread_id].items():
+            excess = len(checkpoints) - self.max_checkpoints_per_thread
+            if excess <= 0:
+                continue
+            for checkpoint_id in sorted(checkpoints)[:excess]:
+                del checkpoints[checkpoint_id]
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+    def _evict(self):
+        """Drop least recently used threads over the cap and threads idle past the TTL"""
+        now = time.monotonic()
+        while self._last_used:
+            thread_id, last_used = next(iter(self._last_used.items()))
+            if len(self._last_used) <= self.max_threads and now - last_used < self.idle_ttl:
+                break
+            self.delete_thread(thread_id)
+            self.evicted_threads += 1
+
+    def delete_thread(self, thread_id):
+        """Forget every checkpoint and pending write of a thread"""
+        with self._lock:
+            self._last_used.pop(thread_id, None)
+            self.storage.pop(thread_id, None)
+            for key in [key for key in self.writes if key[0] == thread_id]:
+                del self.writes[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threads": len(self._last_used),
+                "checkpoints": sum(len(c) for ns in self.storage.values() for c in ns.values()),
+                "evicted_threads": self.evicted_threads,
+                "max_threads": self.max_threads,
+                "max_checkpoints_per_thread": self.max_checkpoints_per_thread,
+                "idle_ttl_seconds": self.idle_ttl,
+            }
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """Durable checkpoints shared by worker processes, with the BoundedMemorySaver limits"""
+
+    def __init__(self, path: str, *, max_threads: int = 1000, max_checkpoints_per_thread: int = 5,
+                 idle_ttl: float = 3600, evict_interval: float = 60, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.max_threads = max_threads
+        self.max_checkpoints_per_thread = max(2, max_checkpoints_per_thread)
+        self.idle_ttl = idle_ttl
+        self.evict_interval = evict_interval
+        self.evicted_threads = 0
+        self.blobs_written = 0
+        self.blobs_reused = 0
+        self._next_evict = 0.0
+        self._lock = threading.Lock()
+        self._db = shared_db.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS threads_last_used ON threads (last_used);
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_id TEXT,
+                type TEXT NOT NULL,
+                checkpoint BLOB NOT NULL,
+                metadata_type TEXT NOT NULL,
+                metadata BLOB NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                version TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+            );
+            CREATE TABLE IF NOT EXISTS checkpoint_writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+        """)
+
+    # -- reads --------------------------------------------------------------
+
+    def _tuple(self, thread_id, checkpoint_ns, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint_b, metadata_type, metadata_b = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint_b))
+        values = {}
+        for channel, version in checkpoint["channel_versions"].items():
+            blob = self._db.execute(
+                "SELECT type, value FROM checkpoint_blobs "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if blob is not None and blob[0] != "empty":
+                values[channel] = self.serde.loads_typed((blob[0], blob[1]))
+        writes = self._db.execute(
+            "SELECT task_id, channel, type, value FROM checkpoint_writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        sends = []
+        if parent_id:
+            sends = self._db.execute(
+                "SELECT type, value FROM checkpoint_writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ? ORDER BY task_id, idx",
+                (thread_id, checkpoint_ns, parent_id, TASKS),
+            ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint={
+                **checkpoint,
+                "channel_values": values,
+                "pending_sends": [self.serde.loads_typed(tuple(s)) for s in sends],
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            parent_config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id,
+            }} if parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._db.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._db.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            return self._tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                if filter:
+                    metadata = self.serde.loads_typed((row[4], row[5]))
+                    if not all(metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                results.append(self._tuple(thread_id, checkpoint_ns, row))
+        yield from results
+
+    # -- writes -------------------------------------------------------------
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        stored = checkpoint.copy()
+        stored.pop("pending_sends", None)
+        values = stored.pop("channel_values")
+        # Only channels updated in this step get a new blob; unchanged ones point at the stored version
+        blobs = [
+            (thread_id, checkpoint_ns, channel, str(version),
+             *(self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)))
+            for channel, version in new_versions.items()
+        ]
+        type_, checkpoint_b = self.serde.dumps_typed(stored)
+        metadata_type, metadata_b = self.serde.dumps_typed(metadata)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO checkpoint_blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                     type_, checkpoint_b, metadata_type, metadata_b),
+                )
+                self._db.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+                self._trim(thread_id, checkpoint_ns)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self.blobs_written += len(blobs)
+            self.blobs_reused += len(checkpoint["channel_versions"]) - len(blobs)
+            self._evict()
+        return {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(self, config, writes, task_id):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = [
+            (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel,
+             *self.serde.dumps_typed(value))
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _trim(self, thread_id, checkpoint_ns):
+        """Drop all but the newest checkpoints of a thread, then the blobs none of them reference"""
+        old = [row[0] for row in self._db.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.max_checkpoints_per_thread),
+        )]
+        if not old:
+            return
+        for checkpoint_id in old:
+            self._db.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+            self._db.execute(
+                "DELETE FROM checkpoint_writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+        referenced = set()
+        for type_, checkpoint_b in self._db.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchall():
+            referenced.update(
+                (channel, str(version))
+                for channel, version in self.serde.loads_typed((type_, checkpoint_b))["channel_versions"].items()
+            )
+        stale = [
+            (thread_id, checkpoint_ns, channel, version)
+            for channel, version in self._db.execute(
+                "SELECT channel, version FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            ).fetchall()
+            if (channel, version) not in referenced
+        ]
+        self._db.executemany(
+            "DELETE FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            stale,
+        )
+
+    def _evict(self):
+        """Every evict_interval: drop threads idle past the TTL and the least recently used over the cap"""
+        now = time.time()
+        if now < self._next_evict:
+            return
+        self._next_evict = now + self.evict_interval
+        expired = [row[0] for row in self._db.execute(
+            "SELECT thread_id FROM (SELECT thread_id, last_used, "
+            "ROW_NUMBER() OVER (ORDER BY last_used DESC) AS rank FROM threads) "
+            "WHERE last_used < ? OR rank > ?",
+            (now - self.idle_ttl, self.max_threads),
+        )]
+        if not expired:
+            return
+        self._db.execute("BEGIN IMMEDIATE")
+        for thread_id in expired:
+            self._delete(thread_id)
+        self._db.execute("COMMIT")
+        self.evicted_threads += len(expired)
+
+    def _delete(self, thread_id):
+        for table in ("threads", "checkpoints", "checkpoint_blobs", "checkpoint_writes"):
+            self._db.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def delete_thread(self, thread_id):
+        """Forget every checkpoint, channel value and pending write of a thread"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._delete(thread_id)
+            self._db.execute("COMMIT")
+
+    # -- async: sqlite calls are short, run them on the default executor -----
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id)
+
+    def get_next_version(self, current, channel):
+        """Same sortable string versions as MemorySaver"""
+        current_v = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def stats(self) -> dict:
+        with self._lock:
+            threads, checkpoints, blobs = self._db.execute(
+                "SELECT (SELECT COUNT(*) FROM threads), (SELECT COUNT(*) FROM checkpoints), "
+                "(SELECT COUNT(*) FROM checkpoint_blobs)"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "channel_blobs": blobs,
+            "blobs_written": self.blobs_written,
+            "blobs_reused": self.blobs_reused,
+            "evicted_threads": self.evicted_threads,
+            "max_threads": self.max_threads,
+            "max_checkpoints_per_thread": self.max_checkpoints_per_thread,
+            "idle_ttl_seconds": self.idle_ttl,
+        }
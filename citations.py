@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Citations
+
+Retrieved documents are registered in a per-request `CitationTable` and shown
+to the model by short id (`<Document id="3">`) instead of by URL. The model
+cites them inline as `[3]` (or `[1][3]`, `[1, 3]`), which costs a couple of
+tokens instead of a copied URL and a written-out sources list.
+
+`CitationTracker` follows the answer while it streams, maps every new id to
+its URL as soon as the closing bracket arrives (a citation split across
+chunks is held back until it is complete) and builds the "📚 Sources" footer
+from the ids actually cited - no regex pass over the finished answer.
+"""
+
+import re
+
+CITATION_RE = re.compile(r"\[(\d{1,3}(?:\s*,\s*\d{1,3})*)\]")
+_MAX_PENDING = 24  # longest "[12, 13, 14" worth holding back for the next chunk
+
+
+class CitationTable:
+    """URL <-> short numeric id for one request (ids start at 1, in registration order)"""
+
+    def __init__(self):
+        self._ids = {}  # url -> id
+        self.urls = []  # id - 1 -> url
+
+    def register(self, url: str) -> int:
+        if url not in self._ids:
+            self.urls.append(url)
+            self._ids[url] = len(self.urls)
+        return self._ids[url]
+
+    def url(self, citation_id: int):
+        return self.urls[citation_id - 1] if 0 < citation_id <= len(self.urls) else None
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+
+class CitationTracker:
+    """Incremental [n] -> URL mapping over a streamed answer"""
+
+    def __init__(self, table: CitationTable):
+        self.table = table
+        self.cited = []  # ids in the order they were first cited
+        self._pending = ""
+
+    def feed(self, text: str) -> list:
+        """Ids cited for the first time in this chunk"""
+        buffer = self._pending + text
+        new, end = [], 0
+        for match in CITATION_RE.finditer(buffer):
+            end = match.end()
+            for part in match.group(1).split(","):
+                citation_id = int(part)
+                if citation_id not in self.cited and self.table.url(citation_id):
+                    self.cited.append(citation_id)
+                    new.append(citation_id)
+        start = buffer.rfind("[")
+        unfinished = start >= end and "]" not in buffer[start:] and len(buffer) - start <= _MAX_PENDING
+        self._pending = buffer[start:] if unfinished else ""
+        return new
+
+    def sources(self) -> list:
+        """Cited URLs, first citation first"""
+        return [self.table.url(citation_id) for citation_id in self.cited]
+
+    def citations(self) -> dict:
+        """id -> URL for everything cited so far"""
+        return {citation_id: self.table.url(citation_id) for citation_id in self.cited}
+
+    def footer(self) -> str:
+        if not self.cited:
+            return ""
+        lines = [f"[{citation_id}] {self.table.url(citation_id)}" for citation_id in sorted(self.cited)]
+        return "\n\n📚 Sources:\n" + "\n".join(lines)
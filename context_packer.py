@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Context Packer
+
+Assembles the prompt context for generate_ans. Retrieved documents (Tavily
+results and full Wikipedia articles) are split into passages, ranked against
+the question with a local BM25 scorer and packed - best first - into a token
+budget. Every kept passage stays attached to its document, which is labelled
+with a short citation id (see citations.py) rather than its URL.
+"""
+
+import math
+import re
+from collections import Counter
+
+from citations import CitationTable
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me my "
+    "of on or should the this to was what when which who why will with you your".split()
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9$]+(?:\.[a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+def split_passages(text: str, max_words: int = 120) -> list:
+    """Split on paragraph boundaries, then cut long paragraphs into max_words windows"""
+    passages = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        for start in range(0, len(words), max_words):
+            passage = " ".join(words[start:start + max_words])
+            if passage:
+                passages.append(passage)
+    return passages
+
+
+class BM25:
+    """Okapi BM25 over an in-memory list of tokenized passages"""
+
+    def __init__(self, corpus: list, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokens) for tokens in corpus]
+        self.lengths = [len(tokens) for tokens in corpus]
+        self.avg_length = (sum(self.lengths) / len(corpus)) if corpus else 0.0
+        doc_freqs = Counter(term for tokens in corpus for term in set(tokens))
+        n = len(corpus)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def score(self, query_tokens: list, index: int) -> float:
+        tf = self.term_freqs[index]
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+        total = 0.0
+        for term in query_tokens:
+            freq = tf.get(term)
+            if freq:
+                total += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+        return total
+
+
+def pack_context(question: str, context: list, token_budget: int = 3000, passage_words: int = 120,
+                 citations: CitationTable = None) -> str:
+    """Top passages for the question, grouped per document, within token_budget
+
+    Documents that make it into the prompt are registered in `citations` and
+    labelled with their id.
+    """
+    citations = CitationTable() if citations is None else citations
+    notes = [item for item in context if isinstance(item, str)]  # e.g. carried-over summaries
+    docs = [item for item in context if isinstance(item, dict)]
+
+    budget = token_budget - sum(estimate_tokens(note) for note in notes)
+    passages = []  # (doc index, position in doc, text)
+    for doc_index, doc in enumerate(docs):
+        for position, text in enumerate(split_passages(doc.get("content", ""), passage_words)):
+            passages.append((doc_index, position, text))
+
+    selected = {}  # doc index -> [(position, text)]
+    best_rank = {}  # doc index -> rank of its best passage
+    if passages:
+        bm25 = BM25([tokenize(text) for _, _, text in passages])
+        query_tokens = tokenize(question)
+        scores = [bm25.score(query_tokens, i) for i in range(len(passages))]
+        ranked = sorted(range(len(passages)), key=lambda i: (-scores[i], passages[i][0], passages[i][1]))
+        for rank, i in enumerate(ranked):
+            doc_index, position, text = passages[i]
+            cost = estimate_tokens(text)
+            if doc_index not in selected:
+                cost += estimate_tokens(docs[doc_index].get("title", "")) + 8  # document wrapper
+            if cost > budget:
+                continue
+            budget -= cost
+            selected.setdefault(doc_index, []).append((position, text))
+            best_rank.setdefault(doc_index, rank)
+
+    blocks = list(notes)
+    for doc_index in sorted(selected, key=best_rank.get):
+        doc = docs[doc_index]
+        citation_id = citations.register(doc.get("url", ""))
+        title = doc.get("title", "").replace('"', "'")
+        body = "\n\n".join(text for _, text in sorted(selected[doc_index]))
+        blocks.append(f'<Document id="{citation_id}"' + (f' title="{title}"' if title else "") + f'>\n{body}\n</Document>')
+    return "\n\n---\n\n".join(blocks)
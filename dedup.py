@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Near-Duplicate Documents
+
+Tavily often returns syndicated copies of the same story (the wire text on
+several sites, AMP and mobile variants of one page), and the same page can
+come back from both retrievers. `DocumentDeduplicator` runs on the merged
+context before it is packed into the prompt:
+
+- exact duplicates: URLs are canonicalized (scheme, www/m/amp host labels,
+  tracking parameters, fragments, trailing slashes) and compared
+- near duplicates: bottom-k MinHash sketches of word shingles estimate the
+  Jaccard similarity of two texts; at `threshold` or above they are the same
+  text (a wire story with a different byline or footer still matches)
+
+Of each group of duplicates the longest document is kept, at the position of
+the first one. Every run returns how many documents and characters it
+removed.
+"""
+
+import hashlib
+import heapq
+import re
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+TRACKING_PARAMS = frozenset({
+    "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "ref", "ref_src",
+    "cmpid", "ncid", "ocid", "soc_src", "soc_trk", "guccounter", "guce_referrer", "guce_referrer_sig",
+    "yptr", ".tsrc",
+})
+HOST_PREFIXES = frozenset({"www", "m", "mobile", "amp"})
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def canonical_url(url: str) -> str:
+    """Form of a URL that differs only between different pages"""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    labels = host.split(".")
+    host = ".".join(label for label in labels[:-2] if label not in HOST_PREFIXES)
+    host = ".".join(filter(None, [host] + labels[-2:]))
+    path = re.sub(r"/(amp|index\.html?)?/?$", "", parts.path) or "/"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_")
+    )
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def minhash(text: str, k: int = 64, shingle_words: int = 3) -> frozenset:
+    """Bottom-k MinHash sketch: the k smallest 64-bit hashes of the text's word shingles"""
+    words = _WORD_RE.findall(text.lower())
+    shingles = {" ".join(words[i:i + shingle_words]) for i in range(max(1, len(words) - shingle_words + 1))}
+    hashes = (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles)
+    return frozenset(heapq.nsmallest(k, hashes))
+
+
+def similarity(a: frozenset, b: frozenset, k: int = 64) -> float:
+    """Estimated Jaccard similarity of the texts behind two sketches"""
+    union = heapq.nsmallest(k, a | b)
+    return sum(1 for value in union if value in a and value in b) / len(union) if union else 0.0
+
+
+class DocumentDeduplicator:
+    """Drops exact (same canonical URL) and near (MinHash) duplicate documents from a context list"""
+
+    def __init__(self, threshold: float = 0.8, min_words: int = 20):
+        self.threshold = threshold  # > 1 disables near-duplicate detection
+        self.min_words = min_words  # shorter texts give unreliable sketches - URL check only
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.documents_in = 0
+        self.documents_removed = 0
+        self.chars_removed = 0
+
+    def dedupe(self, context: list) -> tuple:
+        """(deduplicated context, {"documents_removed", "chars_removed", ...}) - notes pass through"""
+        docs = [item for item in context if isinstance(item, dict)]
+        groups = []  # [kept doc, canonical url, sketch or None]
+        by_url = {}
+        url_duplicates = near_duplicates = chars_removed = 0
+
+        for doc in docs:
+            content = doc.get("content", "")
+            url = canonical_url(doc.get("url", "")) if doc.get("url") else None
+            match = by_url.get(url) if url else None
+            if match is not None:
+                url_duplicates += 1
+            sketch = None
+            if match is None and self.threshold <= 1 and len(_WORD_RE.findall(content)) >= self.min_words:
+                sketch = minhash(content)
+                match = next((
+                    group for group in groups
+                    if group[2] is not None and similarity(group[2], sketch) >= self.threshold
+                ), None)
+                if match is not None:
+                    near_duplicates += 1
+            if match is None:
+                group = [doc, url, sketch]
+                groups.append(group)
+                if url:
+                    by_url[url] = group
+                continue
+            # Same text twice - keep the fuller copy in the earlier slot
+            if len(content) > len(match[0].get("content", "")):
+                chars_removed += len(match[0].get("content", ""))
+                match[0] = doc
+            else:
+                chars_removed += len(content)
+            if url:
+                by_url.setdefault(url, match)
+
+        deduped = [item for item in context if not isinstance(item, dict)] + [group[0] for group in groups]
+        removed = len(docs) - len(groups)
+        with self._lock:
+            self.runs += 1
+            self.documents_in += len(docs)
+            self.documents_removed += removed
+            self.chars_removed += chars_removed
+        return deduped, {
+            "documents_in": len(docs),
+            "documents_removed": removed,
+            "url_duplicates": url_duplicates,
+            "near_duplicates": near_duplicates,
+            "chars_removed": chars_removed,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "documents_in": self.documents_in,
+            "documents_removed": self.documents_removed,
+            "chars_removed": self.chars_removed,
+            "removed_ratio": round(self.documents_removed / self.documents_in, 4) if self.documents_in else 0.0,
+            "threshold": self.threshold,
+        }
@@ -8,30 +8,40 @@ Uses exact same code from research.py with FastAPI wrapper
 # Original imports from research.py - EXACT COPY
 import os
 import getpass
+import asyncio
+import uuid
 import dotenv
 from datetime import datetime, timedelta
 dotenv.load_dotenv()
-os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
+# GOOGLE_API_KEY comes from .env - it is only needed once the LLM is first used
+from functools import lru_cache
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-1.5-pro-latest",  # ✅ or any other from model list
-    temperature=0.7  # You can adjust this
+# Model tier per node / question class - flash takes the classifier, summaries and simple lookups, pro the analysis
+from model_router import FLASH, PRO, ModelRouter, parse_routes, question_class
+model_router = ModelRouter(
+    {
+        FLASH: os.getenv("GEMINI_FLASH_MODEL", "gemini-1.5-flash-latest"),
+        PRO: os.getenv("GEMINI_PRO_MODEL", "gemini-1.5-pro-latest"),  # ✅ or any other from model list
+    },
+    parse_routes(os.getenv("MODEL_ROUTES", "")),
 )
 
-res= llm.invoke("test")
-res.content
-
-res= llm.invoke("True if the user's question requires external search like browser to answer, False otherwise. : what is pervious question i asked ")
-res.content
+@lru_cache(maxsize=None)
+def get_llm(tier=PRO):
+    """Gemini client for a model tier, created on first use (importing this module makes no network calls)"""
+    return ChatGoogleGenerativeAI(
+        model=model_router.model(tier),
+        temperature=0.7  # You can adjust this
+    )
 
 from typing import List
 from typing_extensions import TypedDict
 from langgraph.graph import START, MessagesState, StateGraph
 from pydantic import BaseModel, Field
 import operator
-from typing import Annotated
+from typing import Annotated, Optional, Union
 
 # EXACT COPY of SearchDecision from research.py
 class SearchDecision(BaseModel):
@@ -39,12 +49,19 @@ class SearchDecision(BaseModel):
         description="True if the user's question requires external search to answer, False otherwise."
     )
 
+from turn_context import merge_context, reset_context
+# Characters of previous-turn context carried into the next question (0 = none)
+CONTEXT_CARRY_OVER_CHARS = int(os.getenv("CONTEXT_CARRY_OVER_CHARS", "0"))
+
 # EXACT COPY of Researchstate from research.py
 class Researchstate(MessagesState):
   question:str
   answer:str
-  context: Annotated[list, operator.add]
+  context: Annotated[list, merge_context]  # scoped to the current turn, see turn_context.py
   needs_search: bool
+  summary: str  # rolling summary of turns compacted out of messages, see history.py
+  entities: list  # [{"ticker", "name"}] mentioned in the current question, see symbols.py
+  sources: list  # URLs the current answer cited, see citations.py
 
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.messages import AIMessage
@@ -77,72 +94,339 @@ Remember: For current market analysis, we almost always need fresh, live data fr
 """)
 ]
 
+# Local ticker / company-name index - questions are keyed on canonical tickers (SYMBOL_LISTINGS_PATH="" disables it)
+from symbols import SymbolIndex
+SYMBOL_LISTINGS_PATH = os.getenv(
+    "SYMBOL_LISTINGS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "listings.csv")
+)
+symbol_index = SymbolIndex(SYMBOL_LISTINGS_PATH or None)
+
+# Every Gemini / Tavily / Wikipedia call waits for its provider's rate limit (requests per second, burst)
+from upstream_scheduler import BATCH, UpstreamBusy, UpstreamScheduler, caller
+upstream = UpstreamScheduler(
+    {
+        "gemini": (float(os.getenv("GEMINI_RATE_LIMIT", "5")), float(os.getenv("GEMINI_BURST", "10"))),
+        "tavily": (float(os.getenv("TAVILY_RATE_LIMIT", "5")), float(os.getenv("TAVILY_BURST", "10"))),
+        "wikipedia": (float(os.getenv("WIKIPEDIA_RATE_LIMIT", "20")), float(os.getenv("WIKIPEDIA_BURST", "40"))),
+    },
+    max_queue=int(os.getenv("UPSTREAM_QUEUE_SIZE", "256")),
+)
+
+# Prometheus metrics served on /metrics - node latency, answer streaming, tokens, context and retrieval sizes
+import time
+from metrics import Registry, record_timing, request_timings, server_timing
+metrics = Registry()
+node_seconds = metrics.histogram("research_node_seconds", "Wall time of each graph node", ["node"])
+llm_ttft_seconds = metrics.histogram("research_llm_ttft_seconds", "Time from the answer LLM call to its first streamed token")
+llm_stream_seconds = metrics.histogram("research_llm_stream_seconds", "Total time of the streamed answer LLM call")
+llm_tokens = metrics.counter(
+    "research_llm_tokens_total", "Answer tokens sent to / received from Gemini (estimated when not reported)", ["kind"]
+)
+llm_call_seconds = metrics.histogram(
+    "research_llm_call_seconds", "Wall time of each Gemini call by model tier and node", ["tier", "node"]
+)
+llm_tier_tokens = metrics.counter(
+    "research_llm_tier_tokens_total", "Gemini tokens by model tier (estimated when not reported)", ["tier", "kind"]
+)
+
+def record_llm_call(tier, node, seconds, input_tokens, output_tokens):
+  """Per-tier latency and token usage of one Gemini call (metrics + /cache/stats)"""
+  llm_call_seconds.observe(seconds, tier=tier, node=node)
+  llm_tier_tokens.inc(input_tokens, tier=tier, kind="prompt")
+  llm_tier_tokens.inc(output_tokens, tier=tier, kind="completion")
+  model_router.record(tier, node, seconds, input_tokens, output_tokens)
+context_chars = metrics.histogram(
+    "research_context_chars", "Characters of packed retrieval context sent with an answer",
+    buckets=(0, 1000, 2500, 5000, 10000, 20000, 40000),
+)
+documents_retrieved = metrics.histogram(
+    "research_documents_retrieved", "Documents returned by one retrieval node run", ["source"],
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12),
+)
+retrieval_failures = metrics.counter(
+    "research_retrieval_failures_total", "Retrieval node runs skipped after a deadline or provider error", ["source", "error"]
+)
+duplicate_documents_removed = metrics.histogram(
+    "research_duplicate_documents_removed", "Duplicate documents dropped from one answer's context",
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12),
+)
+duplicate_chars_removed = metrics.histogram(
+    "research_duplicate_chars_removed", "Characters of duplicate documents dropped from one answer's context",
+    buckets=(0, 500, 1000, 2500, 5000, 10000, 20000, 40000),
+)
+
+def timed_node(name, node):
+  """Graph node wrapper recording its wall time in research_node_seconds and the request's timings"""
+  async def run(state, config):
+    started = time.perf_counter()
+    try:
+      return await node(state, config)
+    finally:
+      elapsed = time.perf_counter() - started
+      node_seconds.observe(elapsed, node=name)
+      record_timing(name, elapsed)
+  return run
+
+from search_classifier import SearchClassifier
+search_classifier = SearchClassifier(
+    memo_size=int(os.getenv("CLASSIFIER_MEMO_SIZE", "2048")),
+    fast_path=os.getenv("CLASSIFIER_FAST_PATH", "true").lower() in ("1", "true", "yes"),
+)
+
+from speculation import Speculation
+speculation = Speculation(enabled=os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() in ("1", "true", "yes"))
+
 # EXACT COPY of check function from research.py
-def check(state):
+async def check(state, config):
   question = state["question"]
-  decision_model = llm.with_structured_output(SearchDecision)
-  decision = decision_model.invoke(search_classifier_prompt + [HumanMessage(content=question)])
-  return {"needs_search": decision.needs_search,
+  entities = symbol_index.extract(question)
+  # Clear cases (and questions seen before) are decided locally - the LLM only gets the rest
+  needs_search = search_classifier.classify(question, entities)
+  if needs_search is None:
+    # Retrieval starts now and overlaps the classifier call - thrown away if no search is needed
+    speculation_key = speculation.key(config, question)
+    speculative_state = {**state, "entities": entities}
+    speculation.start(speculation_key, {
+        "search_web": lambda: search_web(speculative_state, config),
+        "search_wikipedia": lambda: search_wiki(speculative_state, config),
+    })
+    try:
+      await upstream.acquire("gemini", *caller(config))
+      tier = model_router.tier("check")
+      decision_model = get_llm(tier).with_structured_output(SearchDecision)
+      classifier_messages = search_classifier_prompt + [HumanMessage(content=question)]
+      started = time.perf_counter()
+      decision = await decision_model.ainvoke(classifier_messages)
+      # Structured output carries no usage metadata - estimate from the prompt and the decision
+      record_llm_call(tier, "check", time.perf_counter() - started,
+                      estimate_tokens("".join(m.content for m in classifier_messages)), estimate_tokens(str(decision)))
+    except BaseException:
+      speculation.discard(speculation_key)
+      raise
+    needs_search = decision.needs_search
+    search_classifier.record_llm(question, needs_search)
+    if not needs_search:
+      speculation.discard(speculation_key)
+  return {"needs_search": needs_search,
+          "entities": entities,
+          "context": reset_context(CONTEXT_CARRY_OVER_CHARS),  # new turn - drop last question's retrieval
           "messages": state["messages"]}
 
 import os
 os.environ["TAVILY_API_KEY"] = "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"
 
 from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_community.document_loaders import WikipediaLoader
-tavily_search = TavilySearchResults(max_results=3)
+
+# One keep-alive connection pool per upstream, shared by every search in the process
+from http_clients import PooledClient, PooledTavilyAPIWrapper, WikipediaClient
+HTTP_OPTIONS = dict(
+    max_retries=int(os.getenv("HTTP_MAX_RETRIES", "2")),
+    backoff=float(os.getenv("HTTP_BACKOFF", "0.3")),
+    backoff_max=float(os.getenv("HTTP_BACKOFF_MAX", "4")),
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")),
+    read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "10")),
+)
+tavily_http = PooledClient("https://api.tavily.com", pool_size=int(os.getenv("TAVILY_POOL_SIZE", "10")), **HTTP_OPTIONS)
+wikipedia_http = PooledClient("https://en.wikipedia.org", pool_size=int(os.getenv("WIKIPEDIA_POOL_SIZE", "10")), **HTTP_OPTIONS)
+wikipedia_client = WikipediaClient(wikipedia_http)
+
+@lru_cache(maxsize=None)
+def get_tavily_search():
+    """Tavily search tool, created on first use and shared by every search"""
+    return TavilySearchResults(max_results=6, api_wrapper=PooledTavilyAPIWrapper(http=tavily_http))
+
+# Prompt context budget - retrieved documents are ranked per passage and packed up to this size
+from context_packer import estimate_tokens, pack_context
+from citations import CitationTable, CitationTracker
+from langchain_core.callbacks.manager import adispatch_custom_event
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_PASSAGE_WORDS = int(os.getenv("CONTEXT_PASSAGE_WORDS", "120"))
+# Syndicated copies of a story (and pages both retrievers found) reach the prompt once
+from dedup import DocumentDeduplicator
+deduplicator = DocumentDeduplicator(threshold=float(os.getenv("DEDUP_SIMILARITY", "0.8")))
+
+# Per-source deadlines (seconds) - web and Wikipedia run in parallel and the answer
+# goes ahead with whatever came back in time
+SEARCH_WEB_TIMEOUT = float(os.getenv("SEARCH_WEB_TIMEOUT", "8"))
+SEARCH_WIKI_TIMEOUT = float(os.getenv("SEARCH_WIKI_TIMEOUT", "5"))
+
+# Shared SQLite store for sessions and caches - lets several worker processes serve the same
+# sessions and survives restarts (unset = everything stays in this process's memory)
+STATE_DB_PATH = os.getenv("STATE_DB_PATH") or None
+
+# Tavily results are reused for everyone asking the same question inside one freshness bucket
+from search_cache import SearchCache, normalize_question
+search_cache = SearchCache(
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "300")),
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512")),
+    path=os.getenv("SEARCH_CACHE_PATH") or STATE_DB_PATH,
+)
+
+# Wikipedia articles barely change - keep them in a local document store (WIKI_CACHE_PATH="" disables it)
+from wiki_store import WikiStore
+WIKI_CACHE_PATH = os.getenv("WIKI_CACHE_PATH", "wiki_cache.db")
+
+@lru_cache(maxsize=None)
+def get_wiki_store():
+    """Wikipedia document store, opened on first use (importing this module creates no files)"""
+    if not WIKI_CACHE_PATH:
+        return None
+    return WikiStore(
+        WIKI_CACHE_PATH,
+        ttl=float(os.getenv("WIKI_CACHE_TTL", str(7 * 24 * 3600))),
+        max_bytes=int(float(os.getenv("WIKI_CACHE_MAX_MB", "200")) * 1024 * 1024),
+        revalidate=os.getenv("WIKI_CACHE_REVALIDATE", "false").lower() in ("1", "true", "yes"),
+        client=wikipedia_client,
+    )
+
+# Conversation history - the prompt carries a rolling summary plus the newest turns within this budget;
+# older turns are summarized in the background once the stored history grows past it
+from history import HistoryCompactor, prompt_history, summary_prompt
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+
+history_summary_prompt = SystemMessage(content="""
+You maintain a running summary of a conversation between a user and a stock market research assistant.
+Merge the current summary with the new conversation turns into one updated summary of at most 200 words.
+Keep the stocks and tickers discussed, key figures and dates quoted, recommendations given and open questions.
+Return only the summary.
+""")
+
+async def summarize_history(previous_summary, messages):
+  """Fold older turns into the thread's rolling summary (runs in the background)"""
+  await upstream.acquire("gemini", BATCH, "history-compaction")
+  transcript = "\n".join(f"{m.type}: {m.content}" for m in messages)
+  summary_messages = [history_summary_prompt, HumanMessage(
+      content=f"Current summary:\n{previous_summary or '(none)'}\n\nNew conversation turns:\n{transcript}"
+  )]
+  tier = model_router.tier("summarize")
+  started = time.perf_counter()
+  response = await get_llm(tier).ainvoke(summary_messages)
+  usage = getattr(response, "usage_metadata", None) or {}
+  record_llm_call(tier, "summarize", time.perf_counter() - started,
+                  usage.get("input_tokens") or estimate_tokens("".join(m.content for m in summary_messages)),
+                  usage.get("output_tokens") or estimate_tokens(response.content))
+  return response.content
+
+history_compactor = HistoryCompactor(
+    lambda: get_graph(),
+    summarize_history,
+    token_budget=HISTORY_TOKEN_BUDGET,
+    keep_messages=int(os.getenv("HISTORY_KEEP_MESSAGES", "4")),
+)
+
+# Concurrent identical retrievals (e.g. a watchlist batch) share one upstream call
+from single_flight import SingleFlight
+from answer_cache import SemanticAnswerCache, question_kind
+retrieval_flights = SingleFlight()
+
+async def load_wiki_docs(query, max_docs, config):
+  """Wikipedia lookup backed by the local document store"""
+  who = caller(config)
+  loop = asyncio.get_running_loop()
+  def acquire(cost):
+    # Revision checks run on the store's worker thread - they wait for the same rate limit on the loop
+    asyncio.run_coroutine_threadsafe(upstream.acquire("wikipedia", *who, cost=cost), loop).result()
+  # The Wikipedia client and the SQLite store are blocking - keep them off the event loop
+  wiki_store = await asyncio.to_thread(get_wiki_store)
+  if wiki_store is not None:
+    docs = await asyncio.to_thread(wiki_store.get, query, acquire)
+    if docs is not None:
+      return docs
+  await upstream.acquire("wikipedia", *who, cost=1 + max_docs)  # one search + one request per page
+  docs = await asyncio.to_thread(wikipedia_client.load, query, max_docs)
+  if wiki_store is not None:
+    await asyncio.to_thread(wiki_store.put, query, docs, acquire)
+  return docs
 
 # EXACT COPY of search_web function from research.py
-def search_web(state):
+async def search_web(state, config):
   """retrives docs from web search """
-  tavily_search=TavilySearchResults(max_results=6)
   now = datetime.now()
   three_days_ago = now - timedelta(days=3)
     
   now_str = now.strftime('%Y-%m-%d %H:%M')
   past_str = three_days_ago.strftime('%Y-%m-%d %H:%M')
   original_question = state["question"]
+  companies = "; ".join(f"{e['name']} ({e['ticker']})" for e in state.get("entities") or [])
   enhanced_query = (
-        f"{original_question} updates, prices, or news from {past_str} to {now_str}, "
+        f"{original_question} {'[' + companies + '] ' if companies else ''}updates, prices, or news from {past_str} to {now_str}, "
         f"latest market activity, recent performance past 72 hours"
     )
   # print(enhanced_query)  # Removed to prevent backend noise during streaming
-  search_docs= tavily_search.invoke(enhanced_query)
+  # "AAPL price" and "what's the price of Apple stock?" share one cache entry
+  cache_key = search_cache.make_key(symbol_index.canonical_question(original_question))
+  search_docs = await search_cache.aget(cache_key)
+  if search_docs is None:
+    async def call():
+      await upstream.acquire("tavily", *caller(config))
+      return await get_tavily_search().ainvoke(enhanced_query)
+    async def fetch():
+      docs = await asyncio.wait_for(call(), timeout=SEARCH_WEB_TIMEOUT)  # queueing counts against the deadline
+      if isinstance(docs, str):  # the tool reports provider errors as a string - don't cache them
+        raise RuntimeError(docs)
+      await search_cache.aset(cache_key, docs)
+      return docs
+    try:
+      search_docs= await retrieval_flights.run(("web", cache_key), fetch)
+    except Exception as e:  # deadline or provider error - don't hold up the answer
+      retrieval_failures.inc(source="web", error=type(e).__name__)
+      documents_retrieved.observe(0, source="web")
+      return {"context":[]}
+  documents_retrieved.observe(len(search_docs), source="web")
   
-  formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document href="{doc["url"]}">\n{doc["content"]}\n\n**SOURCE URL: {doc["url"]}**\n</Document>'
-            for doc in search_docs
-        ]
-    )
-  return {"context":[formatted_search_docs]}
+  # Raw documents - generate_ans packs the relevant passages into the prompt
+  return {"context":[
+      {"url": doc["url"], "title": doc.get("title", ""), "content": doc["content"], "source": "web"}
+      for doc in search_docs
+  ]}
 
 # EXACT COPY of search_wiki function from research.py
-def search_wiki(state):
+async def search_wiki(state, config):
   """retrives docs from wiki search """
-  search_docs= WikipediaLoader( query= state["question"],load_max_docs=6).load()
-  formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}">\n{doc.page_content}\n\n**SOURCE URL: {doc.metadata["source"]}**\n</Document>'
-            for doc in search_docs
-        ]
+  try:
+    question = state["question"]
+    # Named companies are looked up by their article title, which every phrasing shares
+    entities = state.get("entities") or []
+    queries = [(e["name"], max(1, 6 // len(entities))) for e in entities] or [(question, 6)]
+    results = await asyncio.wait_for(
+        asyncio.gather(*(
+            retrieval_flights.run(("wiki", normalize_question(query), max_docs),
+                                  lambda query=query, max_docs=max_docs: load_wiki_docs(query, max_docs, config))
+            for query, max_docs in queries
+        )),
+        timeout=SEARCH_WIKI_TIMEOUT,
     )
-  return {"context":[formatted_search_docs]}
+    search_docs = list({doc.metadata["source"]: doc for docs in results for doc in docs}.values())
+  except Exception as e:  # deadline or provider error - don't hold up the answer
+    retrieval_failures.inc(source="wikipedia", error=type(e).__name__)
+    documents_retrieved.observe(0, source="wikipedia")
+    return {"context":[]}
+  documents_retrieved.observe(len(search_docs), source="wikipedia")
+  return {"context":[
+      {"url": doc.metadata["source"], "title": doc.metadata.get("title", ""), "content": doc.page_content, "source": "wikipedia"}
+      for doc in search_docs
+  ]}
 
-# Modified generate_ans function with streaming support
-def generate_ans(state, stream=False):
+# Modified generate_ans function - tokens reach the API through graph.astream_events()
+async def generate_ans(state, config):
   """node to answer a question """
-  context= state["context"]
   question= state["question"]
+  # Only the passages most relevant to the question, within the prompt token budget,
+  # labelled with short citation ids the answer refers to as [n]
+  citations = CitationTracker(CitationTable())
+  documents, duplicates = deduplicator.dedupe(state["context"])
+  if duplicates["documents_in"]:
+    duplicate_documents_removed.observe(duplicates["documents_removed"])
+    duplicate_chars_removed.observe(duplicates["chars_removed"])
+  context= pack_context(question, documents, CONTEXT_TOKEN_BUDGET, CONTEXT_PASSAGE_WORDS, citations.table)
+  context_chars.observe(len(context))
   needs_search= state["needs_search"]
   messages = state.get("messages", [])
-
-  # Initialize variables for streaming
-  full_response = ""
+  # Newest turns + the rolling summary in the system prompt - prompt size stays flat however long the conversation gets
+  history = prompt_history(messages, HISTORY_TOKEN_BUDGET)
+  summary = summary_prompt(state.get("summary", ""))
 
   if needs_search:
-    if not stream:
-        print("📈 Fetching live stock market data...")
     current_date = datetime.now().strftime('%B %d, %Y')
     system_message = SystemMessage(content=f"""
 You are a Stock Market Research Assistant providing educational analysis and market information. Your role is to analyze publicly available market data and present factual information to help users understand market conditions.
@@ -177,18 +461,16 @@ IMPORTANT: Adapt your response based on the question type:
 - Be specific with numbers, dates, and sources
 -for direct questions, give a direct answer with the specific data requested no source needed
 - This is for educational/informational purposes only
-- Always end with "📚 Sources:" section with URLs from the provided context
+- Cite the documents you use inline by their id in square brackets, e.g. [1] or [2][5]
+- Do not write out URLs or a sources list - the cited documents' links are added after your answer
 
 **Question: {question}**
 
 Provide an appropriate response matching the question's complexity and scope.
 """)
-    messages = messages+[system_message]
     final_messages = [system_message, HumanMessage(content=question)]
     
   else:
-    if not stream:
-        print("💬 Using previous stock discussion...")
     # Add intelligent context message for non-search questions
     context_message = SystemMessage(content=f"""
 You are a Stock Market Research Assistant providing educational market information.
@@ -202,39 +484,57 @@ IMPORTANT: Adapt your response based on the question type and conversation conte
 Always maintain focus on stock market topics and educational content.
 
 Question: {question}
-""")
+{summary}""")
     human_message = HumanMessage(content=question)
-    messages =messages + [human_message]
-    final_messages = messages
+    # One system message, first - Gemini rejects a system message anywhere else
+    final_messages = [context_message] + history + [human_message]
 
-  # Always stream - single unified approach
-  # Make ONE LLM call to avoid different responses
-  llm_response = list(llm.stream(final_messages))
-  print(llm_response)
-  
-  if stream:
-      # Return generator for streaming
-      def stream_generator():
-          for chunk in llm_response:
-              if chunk.content:
-                  print(chunk.content)
-                  yield chunk.content
-      return stream_generator()
-  else:
-      # Accumulate all chunks for non-streaming
-      full_response = ""
-      for chunk in llm_response:
-          if chunk.content:
-              full_response += chunk.content
+  # ONE LLM call per question - each chunk is also surfaced to the API as an
+  # on_chat_model_stream event, so the same generation feeds the SSE response.
+  # Simple lookups, follow-ups and general questions go to the flash model, analysis to pro
+  tier = model_router.tier("generate_answer", question_class(question, state.get("entities")))
+  await upstream.acquire("gemini", *caller(config))
+  full_response = ""
+  started = time.perf_counter()
+  usage = {}
+  async for chunk in get_llm(tier).astream(final_messages):
+      if chunk.content:
+          if not full_response:
+              ttft = time.perf_counter() - started
+              llm_ttft_seconds.observe(ttft)
+              record_timing("ttft", ttft)
+          full_response += chunk.content
+          # Cited documents reach the client as soon as their [n] is complete
+          if citations.feed(chunk.content):
+              await adispatch_custom_event("sources", {
+                  "sources": citations.sources(), "citations": citations.citations(),
+              }, config=config)
+      for kind, count in (getattr(chunk, "usage_metadata", None) or {}).items():
+          usage[kind] = max(usage.get(kind, 0), count)  # cumulative or final-chunk reporting
+  stream_time = time.perf_counter() - started
+  llm_stream_seconds.observe(stream_time)
+  record_timing("stream", stream_time)
+  prompt_text = "".join(str(m.content) for m in final_messages)
+  prompt_tokens = usage.get("input_tokens") or estimate_tokens(prompt_text)
+  completion_tokens = usage.get("output_tokens") or estimate_tokens(full_response)
+  llm_tokens.inc(prompt_tokens, kind="prompt")
+  llm_tokens.inc(completion_tokens, kind="completion")
+  record_llm_call(tier, "generate_answer", stream_time, prompt_tokens, completion_tokens)
+  # Links of the documents the answer cited
+  full_response += citations.footer()
+  # Only the question and answer are stored - prompts and retrieved context stay out of the checkpoint
+  turn = [HumanMessage(content=question), AIMessage(content=full_response)]
   return {
           "answer": full_response,
-          "messages": messages + [AIMessage(content=full_response)]
+          "sources": citations.sources(),
+          "messages": turn
       }
 
 # EXACT COPY of route_based_on_search function from research.py
-def route_based_on_search(state) -> str:
+def route_based_on_search(state) -> Union[str, List[str]]:
     if state.get("needs_search"):
-        return "search_web"
+        # Fan out - both retrievers run in the same step and merge through the context reducer
+        return ["search_web", "search_wikipedia"]
     else:
         return "generate_answer"
 
@@ -247,33 +547,53 @@ from langchain_core.messages import HumanMessage ,SystemMessage
 from langgraph.checkpoint.memory import MemorySaver
 
 # EXACT COPY of graph setup from research.py
-memory=MemorySaver()
+# Bounded per-session storage - idle threads are evicted and only the latest checkpoints kept
+from checkpointer import BoundedMemorySaver, SqliteCheckpointSaver
+session_limits = dict(
+    max_threads=int(os.getenv("MAX_SESSIONS", "1000")),
+    max_checkpoints_per_thread=int(os.getenv("MAX_CHECKPOINTS_PER_SESSION", "5")),
+    idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "3600")),
+)
+memory = SqliteCheckpointSaver(STATE_DB_PATH, **session_limits) if STATE_DB_PATH else BoundedMemorySaver(**session_limits)
 
-builder = StateGraph(Researchstate)
+@lru_cache(maxsize=None)
+def get_graph():
+    """Build and compile the research graph on first use"""
+    builder = StateGraph(Researchstate)
 
-builder.add_node("check",check)
+    builder.add_node("check", timed_node("check", check))
 
-# Initialize each node with node_secret
-builder.add_node("search_web",search_web)
-builder.add_node("search_wikipedia", search_wiki)
-builder.add_node("generate_answer", generate_ans)
+    # Initialize each node with node_secret
+    # Retrieval nodes pick up what check started speculatively, see speculation.py
+    builder.add_node("search_web", timed_node("search_web", speculation.node("search_web", search_web)))
+    builder.add_node("search_wikipedia", timed_node("search_wikipedia", speculation.node("search_wikipedia", search_wiki)))
+    builder.add_node("generate_answer", timed_node("generate_answer", generate_ans))
 
-# Flow
-builder.add_edge(START, "check")
-builder.add_conditional_edges(
-    "check",                    # the current node name
-    route_based_on_search,      # your routing function
-    ["search_web", "generate_answer"]  # possible destinations
-)
-builder.add_edge("search_web", "search_wikipedia")
-builder.add_edge("search_wikipedia", "generate_answer")
-builder.add_edge("generate_answer", END)
-graph = builder.compile(checkpointer=memory)
+    # Flow
+    builder.add_edge(START, "check")
+    builder.add_conditional_edges(
+        "check",                    # the current node name
+        route_based_on_search,      # your routing function
+        ["search_web", "search_wikipedia", "generate_answer"]  # possible destinations
+    )
+    builder.add_edge(["search_web", "search_wikipedia"], "generate_answer")
+    builder.add_edge("generate_answer", END)
+    return builder.compile(checkpointer=memory)
 
 # EXACT COPY of main function from research.py (kept for reference)
+async def ask(question, config):
+    """One CLI turn - waits for history compaction so asyncio.run() doesn't cancel it"""
+    async with history_compactor.turn(config["configurable"]["thread_id"]):
+        result = await get_graph().ainvoke({"question": question}, config=config)
+    # Compaction starts once the turn is checkpointed
+    history_compactor.schedule(config, result.get("messages"))
+    await history_compactor.drain()
+    return result
+
 def main():
     """Main interactive function to get user input and process stock questions"""
-    config = {"configurable": {"thread_id": "stock_session"}}
+    # One conversation thread per CLI run
+    config = {"configurable": {"thread_id": f"cli-{uuid.uuid4().hex}"}}
     
     print("📈 Welcome to the Live Stock Market Research Assistant!")
     print("🔴 LIVE MARKET DATA | 📊 EXPERT ANALYSIS | 💡 INVESTMENT RECOMMENDATIONS")
@@ -304,7 +624,7 @@ def main():
             print("-" * 60)
             
             # Process the question through the graph
-            result = graph.invoke({"question": user_question}, config=config)
+            result = asyncio.run(ask(user_question, config))
             
             # The streaming already happened in generate_ans, so we just need to show completion
             print(f"\n✅ Analysis completed!")
@@ -322,13 +642,12 @@ def main():
 # FastAPI WRAPPER - NEW CODE ONLY
 # ===============================================
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel as FastAPIBaseModel
-import re
 import json
-import asyncio
+import time
 
 # Initialize FastAPI app
 app = FastAPI(title="Stock Market Research API", version="1.0.0")
@@ -345,19 +664,28 @@ app.add_middleware(
 # FastAPI Pydantic models
 class QuestionRequest(FastAPIBaseModel):
     question: str
-    # conversation_context removed - graph handles memory automatically with MemorySaver
+    session_id: Optional[str] = None  # conversation thread; a new one is created when missing
+    # conversation_context removed - graph handles memory automatically per session_id thread
+
+class BatchRequest(FastAPIBaseModel):
+    questions: list[str]
+    format: str = "ndjson"  # "ndjson" or "sse"
+    concurrency: Optional[int] = None  # capped at BATCH_CONCURRENCY
 
 class StockAnalysisResponse(FastAPIBaseModel):
     question: str
     answer: str
     needs_search: bool
     sources_used: list[str] = []
+    session_id: Optional[str] = None
 
-def extract_sources_from_answer(answer: str) -> list[str]:
-    """Extract URLs from the answer text"""
-    url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+[^\s<>"{}|\\^`\[\].,;:!?]'
-    urls = re.findall(url_pattern, answer)
-    return list(set(urls))  # Remove duplicates
+# One writer for all SSE responses so its frame/encode counters cover the whole server
+from sse import SSEWriter
+sse_writer = SSEWriter(
+    max_chars=int(os.getenv("SSE_COALESCE_CHARS", "256")),
+    max_delay=float(os.getenv("SSE_COALESCE_MS", "15")) / 1000,
+    queue_size=int(os.getenv("SSE_QUEUE_SIZE", "256")),
+)
 
 @app.get("/")
 async def root():
@@ -369,11 +697,203 @@ async def health_check():
     """Simple health check"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+# Warm-up - the server boots without network calls; clients and the graph are
+# built in the background after startup (or on first use) and /ready reports it
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+WARMUP_PROBE = os.getenv("WARMUP_PROBE", "false").lower() in ("1", "true", "yes")
+warmup_state = {"status": "cold", "error": None, "duration_ms": None}
+_warmup_task = None
+
+async def warm_up():
+    """Create the LLM and search clients, open the Wikipedia store and compile the graph (optionally probe Gemini)"""
+    warmup_state.update(status="warming", error=None)
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(lambda: ([get_llm(tier) for tier in model_router.models], get_tavily_search(), get_wiki_store(), get_graph()))
+        if WARMUP_PROBE:
+            await asyncio.gather(*(get_llm(tier).ainvoke("ping") for tier in model_router.models))
+        warmup_state["status"] = "ready"
+    except Exception as e:
+        warmup_state.update(status="failed", error=str(e))
+    warmup_state["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+@app.on_event("startup")
+async def schedule_warm_up():
+    global _warmup_task
+    if WARMUP_ON_STARTUP:
+        _warmup_task = asyncio.create_task(warm_up())
+
+@app.post("/warmup")
+async def warmup():
+    """Explicit warm-up step"""
+    await warm_up()
+    return warmup_state
+
+@app.get("/ready")
+async def readiness():
+    """Readiness check - 200 once clients and graph are built, 503 before"""
+    components = {
+        "llm": get_llm.cache_info().currsize >= len(model_router.models),
+        "search": get_tavily_search.cache_info().currsize > 0,
+        "graph": get_graph.cache_info().currsize > 0,
+    }
+    ready = all(components.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "warmup": warmup_state, "components": components},
+    )
+
+# Per-request node timings: Server-Timing header on /analyze, a "timing" event on /analyze/stream
+REQUEST_TIMINGS = os.getenv("REQUEST_TIMINGS", "false").lower() in ("1", "true", "yes")
+
+def cache_lookups():
+    caches = {"search": search_cache.stats(), "answers": answer_cache.stats()}
+    # Counters of a store that is already open only - a scrape never opens (or creates) the SQLite file
+    wiki_store = get_wiki_store() if get_wiki_store.cache_info().currsize else None
+    if wiki_store is not None:
+        caches["wikipedia"] = wiki_store.lookup_stats()
+    return caches
+
+def cache_lookup_counts():
+    counts = {}
+    for name, stats in cache_lookups().items():
+        counts[(name, "hit")] = stats["hits"]
+        counts[(name, "miss")] = stats["misses"]
+    return counts
+
+metrics.callback(
+    "research_cache_lookups_total", "Cache lookups by result", cache_lookup_counts, ["cache", "result"], kind="counter"
+)
+metrics.callback(
+    "research_cache_hit_ratio", "Share of cache lookups that were hits",
+    lambda: {(name,): stats["hit_rate"] for name, stats in cache_lookups().items()}, ["cache"],
+)
+metrics.callback(
+    "research_search_decisions_total", "needs_search decisions by path (fast_path, memo, llm)",
+    lambda: {(path,): count for path, count in search_classifier.counts.items()}, ["path"], kind="counter",
+)
+metrics.callback(
+    "research_speculative_retrievals_total", "Retrievals started before the search decision, by outcome",
+    lambda: {(result,): speculation.counts[result] for result in ("used", "wasted")}, ["result"],
+    kind="counter",
+)
+metrics.callback(
+    "research_upstream_waiting", "Upstream calls waiting for a rate-limit token",
+    lambda: {(provider,): stats["waiting"] for provider, stats in upstream.stats().items()}, ["provider"],
+)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text exposition of the latency, token, context and cache metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counts for the caches, classifier paths, SSE framing and session storage usage"""
+    # Session and Wikipedia storage stats query SQLite - keep them off the event loop
+    def storage_stats():
+        wiki_store = get_wiki_store()
+        return memory.stats(), wiki_store.stats() if wiki_store is not None else None
+    sessions, wikipedia = await asyncio.to_thread(storage_stats)
+    return {
+        "classifier": search_classifier.stats(),
+        "dedup": deduplicator.stats(),
+        "models": model_router.stats(),
+        "speculation": speculation.stats(),
+        "symbols": symbol_index.stats(),
+        "retrieval_inflight": retrieval_flights.stats(),
+        "analyze_inflight": analyze_flights.stats(),
+        "stream": sse_writer.stats(),
+        "sessions": sessions,
+        "search": search_cache.stats(),
+        "answers": answer_cache.stats(),
+        "wikipedia": wikipedia,
+        "http": {"tavily": tavily_http.stats(), "wikipedia": wikipedia_http.stats()},
+        "upstream": upstream.stats(),
+        "history": history_compactor.stats(),
+    }
+
+
+# /analyze coalescing - identical questions in flight share one graph run. Search
+# answers don't use conversation history, so they are shared across sessions;
+# anything else is only shared (and cached) within the same session.
+analyze_flights = SingleFlight()
+# Finished answers are reused for paraphrases too, fresh for as long as their kind of question allows
+answer_cache = SemanticAnswerCache(
+    ttls={
+        "live": float(os.getenv("ANSWER_CACHE_TTL_LIVE", "30")),
+        "market": float(os.getenv("ANSWER_CACHE_TTL_MARKET", "300")),
+        # No-search answers are session-scoped and built from that session's history, which the next turn
+        # changes - a paraphrase later on would get an answer to a different conversation, so none are cached
+        "concept": float(os.getenv("ANSWER_CACHE_TTL_CONCEPT", "0")),
+    },
+    max_bytes=int(float(os.getenv("ANSWER_CACHE_MAX_MB", "32")) * 1024 * 1024),
+    threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.85")),
+    path=STATE_DB_PATH,
+)
+
+def answer_cache_scope(question: str, session_id: str) -> tuple:
+    """(scope, canonical question, tickers) an answer is cached and coalesced under"""
+    entities = symbol_index.extract(question)
+    shared = search_classifier.peek(question, entities) is True
+    return ("shared" if shared else session_id), symbol_index.canonical_question(question), [e["ticker"] for e in entities]
+
+async def record_turn(session_id: str, question: str, result: dict) -> None:
+    """Add a coalesced answer to the follower's own conversation thread"""
+    config = {"configurable": {"thread_id": session_id}}
+    async with history_compactor.turn(session_id):
+        await get_graph().aupdate_state(config, {
+            "question": question,
+            "answer": result["answer"],
+            "needs_search": result["needs_search"],
+            "messages": [HumanMessage(content=question), AIMessage(content=result["answer"])],
+        }, as_node="generate_answer")
+    history_compactor.schedule(config)
+
+@app.post("/analyze", response_model=StockAnalysisResponse)
+async def analyze_stock(request: QuestionRequest, response: Response):
+    """
+    Non-streaming analysis - concurrent identical questions wait on a single graph run
+    """
+    started = time.perf_counter()
+    timings = request_timings()
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    session_id = request.session_id or uuid.uuid4().hex
+    
+    scope, canonical, tickers = answer_cache_scope(question, session_id)
+    key = f"{scope}|{canonical}"
+    
+    cached = await answer_cache.aget(scope, canonical, tickers)
+    if cached is not None:
+        await record_turn(session_id, question, cached)
+        return StockAnalysisResponse(question=question, session_id=session_id, **cached)
+    
+    ran_here = False
+    async def execute():
+        nonlocal ran_here
+        ran_here = True
+        return await run_question(question, session_id)
+    
+    try:
+        result = await analyze_flights.run(key, execute)
+        if not ran_here:
+            await record_turn(session_id, question, result)
+    except UpstreamBusy as e:
+        raise HTTPException(status_code=503, detail=f"Upstream busy, retry shortly: {e}", headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    await answer_cache.aset(scope, canonical, tickers, result, question_kind(question, result["needs_search"]))
+    if REQUEST_TIMINGS:
+        response.headers["Server-Timing"] = server_timing({**timings, "total": time.perf_counter() - started})
+    return StockAnalysisResponse(question=question, session_id=session_id, **result)
 
 @app.post("/analyze/stream")
 async def analyze_stock_stream(request: QuestionRequest):
     """
-    Streaming endpoint that sends analysis chunks as they're generated using graph.stream()
+    Streaming endpoint that sends analysis chunks as they're generated using graph.astream_events()
     """
     try:
         question = request.question.strip()
@@ -381,83 +901,107 @@ async def analyze_stock_stream(request: QuestionRequest):
         if not question:
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
-        async def generate_stream():
+        # Each client keeps its own conversation thread
+        session_id = request.session_id or uuid.uuid4().hex
+        
+        async def analysis_events():
+            started = time.perf_counter()
+            timings = request_timings()
             try:
                 # Send initial status
-                yield f"data: {json.dumps({'type': 'status', 'content': 'Thinking...'})}\n\n"
-                
-                # Small delay to ensure frontend connects
-                await asyncio.sleep(0.1)
+                yield {'type': 'status', 'content': 'Thinking...'}
                 
-                # Use same config as regular endpoint - graph handles memory automatically  
-                config = {"configurable": {"thread_id": "stock_session"}}
+                # Graph handles memory automatically - one thread per client session
+                config = {"configurable": {"thread_id": session_id}}
                 # print(f"🔍 API Processing: '{question}'")  # Debug removed
                 
-                # Get the workflow state up to generate_answer, then stream the final response
+                scope, canonical, tickers = answer_cache_scope(question, session_id)
+                cached = await answer_cache.aget(scope, canonical, tickers)
+                if cached is not None:
+                    await record_turn(session_id, question, cached)
+                    yield {'type': 'metadata', 'needs_search': cached['needs_search'], 'session_id': session_id,
+                           'tickers': tickers, 'cached': True}
+                    yield {'type': 'content', 'content': cached['answer']}
+                    yield {'type': 'complete', 'sources': cached['sources_used']}
+                    return
+                
                 full_response = ""
                 needs_search = False
-                context = []
+                sources = []
+                answer_run_id = None
+                history = None
                 
-                # Process through the graph until we reach generate_answer
-                for chunk in graph.stream({"question": question}, config=config):
-                    for node_name, node_output in chunk.items():
-                        if node_name == "check":
-                            needs_search = node_output.get("needs_search", False)
-                            yield f"data: {json.dumps({'type': 'metadata', 'needs_search': needs_search})}\n\n"
-                            await asyncio.sleep(0.1)
-                            
-                        elif node_name == "search_web":
-                            yield f"data: {json.dumps({'type': 'status', 'content': 'Fetching live market data...'})}\n\n"
-                            await asyncio.sleep(0.1)
-                            if "context" in node_output:
-                                context.extend(node_output["context"])
-                            
-                        elif node_name == "search_wikipedia":
-                            yield f"data: {json.dumps({'type': 'status', 'content': 'Searching additional sources...'})}\n\n"
-                            await asyncio.sleep(0.1)
-                            if "context" in node_output:
-                                context.extend(node_output["context"])
-                            
-                        elif node_name == "generate_answer":
-                            yield f"data: {json.dumps({'type': 'status', 'content': 'Generating...'})}\n\n"
-                            await asyncio.sleep(0.1)
-                            
-                            # Now use the REAL streaming from generate_ans
-                            state = {
-                                "question": question,
-                                "context": context,
-                                "needs_search": needs_search,
-                                "messages": node_output.get("messages", [])
-                            }
-                            
-                            # Get the streaming generator from generate_ans
-                            stream_generator = generate_ans(state, stream=True)
-                            
-                            # Stream each chunk as it comes with proper async yielding
-                            for chunk_content in stream_generator:
+                # Single pass through the graph: node events drive the status updates and
+                # the tokens of the ONE generate_answer LLM call are forwarded as they arrive
+                async with history_compactor.turn(session_id):
+                    async for event in get_graph().astream_events({"question": question}, config=config, version="v2"):
+                        kind = event["event"]
+                        node_name = event.get("metadata", {}).get("langgraph_node")
+                        
+                        if kind == "on_chain_start" and event["name"] == node_name:
+                            if node_name == "search_web":
+                                yield {'type': 'status', 'content': 'Fetching live market data...'}
+                            elif node_name == "search_wikipedia":
+                                yield {'type': 'status', 'content': 'Searching additional sources...'}
+                            elif node_name == "generate_answer":
+                                answer_run_id = event["run_id"]
+                                yield {'type': 'status', 'content': 'Generating...'}
+                        
+                        elif kind == "on_chain_end" and event["name"] == node_name:
+                            node_output = event["data"].get("output") or {}
+                            if node_name == "check":
+                                needs_search = node_output.get("needs_search", False)
+                                yield {'type': 'metadata', 'needs_search': needs_search, 'session_id': session_id,
+                                       'tickers': [e['ticker'] for e in node_output.get('entities') or []]}
+                            elif node_name == "generate_answer":
+                                # Final answer checkpointed by the graph - the streamed text plus the sources footer
+                                answer = node_output.get("answer", full_response)
+                                if answer.startswith(full_response) and len(answer) > len(full_response):
+                                    yield {'type': 'content', 'content': answer[len(full_response):]}
+                                full_response = answer
+                                sources = node_output.get("sources") or []
+                        
+                        elif kind == "on_chain_end" and not event.get("parent_ids"):
+                            history = (event["data"].get("output") or {}).get("messages")  # the run's final state
+                    
+                        elif kind == "on_custom_event" and event["name"] == "sources":
+                            # [n] citations mapped to URLs while the answer is still streaming
+                            yield {'type': 'sources', **event["data"]}
+                        
+                        elif kind == "on_chat_model_stream" and answer_run_id in event.get("parent_ids", ()):
+                            # Only the answer call of this run - no other model call that shares the callbacks
+                            chunk_content = event["data"]["chunk"].content
+                            if chunk_content:
                                 full_response += chunk_content
-                                yield f"data: {json.dumps({'type': 'content', 'content': chunk_content})}\n\n"
-                                # Small delay to prevent buffering and ensure real-time streaming
-                                await asyncio.sleep(0.01)
+                                yield {'type': 'content', 'content': chunk_content}
+                # Compaction starts once the turn is checkpointed
+                history_compactor.schedule(config, history)
+                
+                if full_response:
+                    await answer_cache.aset(scope, canonical, tickers,
+                                            {"answer": full_response, "needs_search": needs_search, "sources_used": sources},
+                                            question_kind(question, needs_search))
                 
-                # Extract sources from final response
-                sources = extract_sources_from_answer(full_response)
+                if REQUEST_TIMINGS:
+                    timings["total"] = time.perf_counter() - started
+                    yield {'type': 'timing', 'timings_ms': {name: round(seconds * 1000, 1) for name, seconds in timings.items()}}
                 
                 # Send completion
-                yield f"data: {json.dumps({'type': 'complete', 'sources': sources})}\n\n"
-                await asyncio.sleep(0.1)
+                yield {'type': 'complete', 'sources': sources}
                 
             except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+                yield {'type': 'error', 'content': str(e)}
         
+        # No pacing sleeps - the writer coalesces tokens and flushes status changes immediately
         return StreamingResponse(
-            generate_stream(),
+            sse_writer.stream(analysis_events()),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache, no-store, must-revalidate",
                 "Connection": "keep-alive",
                 "Content-Type": "text/event-stream",
                 "X-Accel-Buffering": "no",  # Disable nginx buffering
+                "X-Session-ID": session_id,
                 "Access-Control-Allow-Origin": "*",
             }
         )
@@ -466,6 +1010,98 @@ async def analyze_stock_stream(request: QuestionRequest):
         # print(f"❌ An error occurred: {e}")  # Removed to prevent backend noise
         raise HTTPException(status_code=500, detail=f"Streaming analysis failed: {str(e)}")
 
+# Watchlist batches - identical questions run once, retrieval is shared through
+# search_cache/retrieval_flights and every item runs on its own throwaway thread
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "200"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+async def run_question(question: str, thread_id: str, batch_id: Optional[str] = None) -> dict:
+    """Run one question through the graph and shape the result like StockAnalysisResponse"""
+    configurable = {"thread_id": thread_id}
+    if batch_id:
+        # Batch work queues behind interactive requests and shares one fair-queuing slot per batch
+        configurable.update(priority="batch", client_id=f"batch-{batch_id}")
+    config = {"configurable": configurable}
+    async with history_compactor.turn(thread_id):
+        result = await get_graph().ainvoke({"question": question}, config=config)
+    # Compaction starts once the turn is checkpointed
+    history_compactor.schedule(config, result.get("messages"))
+    answer = result.get("answer", "")
+    return {
+        "answer": answer,
+        "needs_search": result.get("needs_search", False),
+        "sources_used": result.get("sources") or [],
+    }
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: BatchRequest):
+    """
+    Analyze many questions at once, streaming each result (NDJSON or SSE) as soon as it finishes
+    """
+    if request.format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    questions = [q.strip() for q in request.questions]
+    if not questions:
+        raise HTTPException(status_code=400, detail="questions cannot be empty")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    
+    # Questions that differ only in phrasing (same tickers, same content words) are answered once
+    groups = {}
+    for index, question in enumerate(questions):
+        if question:
+            groups.setdefault(symbol_index.canonical_question(question), []).append(index)
+    concurrency = max(1, min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+    batch_id = uuid.uuid4().hex
+    
+    async def run_group(indexes):
+        async with semaphore:
+            thread_id = f"batch-{batch_id}-{indexes[0]}"
+            try:
+                item = {"status": "ok", **await run_question(questions[indexes[0]], thread_id, batch_id)}
+            except Exception as e:  # one failed question doesn't fail the batch
+                item = {"status": "error", "error": str(e)}
+            finally:
+                await asyncio.to_thread(memory.delete_thread, thread_id)  # SQLite when STATE_DB_PATH is set
+        return indexes, item
+    
+    async def batch_results():
+        started = time.perf_counter()
+        counts = {"ok": 0, "error": 0}
+        for index, question in enumerate(questions):
+            if not question:
+                counts["error"] += 1
+                yield {"type": "result", "index": index, "question": question, "status": "error", "error": "Question cannot be empty"}
+        tasks = [asyncio.create_task(run_group(indexes)) for indexes in groups.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indexes, item = await next_done
+                for index in indexes:
+                    counts[item["status"]] += 1
+                    yield {"type": "result", "index": index, "question": questions[index], **item}
+            yield {
+                "type": "summary",
+                "total": len(questions),
+                "unique_questions": len(groups),
+                "concurrency": concurrency,
+                **counts,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+        finally:
+            for task in tasks:
+                task.cancel()  # client went away - stop the remaining work
+    
+    async def encoded():
+        async for item in batch_results():
+            yield sse_writer.encode(item) if request.format == "sse" else json.dumps(item) + "\n"
+    
+    return StreamingResponse(
+        encoded(),
+        media_type="text/event-stream" if request.format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -6,6 +6,14 @@ function App() {
   const [loading, setLoading] = useState(false)
   const [input, setInput] = useState('')
   const messagesEndRef = useRef(null)
+  // Conversation thread on the backend - kept until the chat is cleared
+  const [sessionId, setSessionId] = useState(() => {
+    const saved = localStorage.getItem('stockSessionId')
+    if (saved) return saved
+    const id = crypto.randomUUID()
+    localStorage.setItem('stockSessionId', id)
+    return id
+  })
 
   // Auto-scroll to bottom
   useEffect(() => {
@@ -63,7 +71,8 @@ function App() {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ 
-          question: currentInput
+          question: currentInput,
+          session_id: sessionId
           // conversation_context removed - graph handles memory automatically
         }),
       })
@@ -72,13 +81,16 @@ function App() {
 
       const reader = response.body.getReader()
       const decoder = new TextDecoder()
+      // Frames can be split across reads - keep the unfinished line for the next chunk
+      let buffered = ''
 
       while (true) {
         const { done, value } = await reader.read()
         if (done) break
 
-        const chunk = decoder.decode(value)
-        const lines = chunk.split('\n')
+        buffered += decoder.decode(value, { stream: true })
+        const lines = buffered.split('\n')
+        buffered = lines.pop()
 
         for (const line of lines) {
           if (line.startsWith('data: ')) {
@@ -127,6 +139,13 @@ function App() {
                     ? { ...msg, content: msg.content + data.content, status: undefined }
                     : msg
                 ))
+              } else if (data.type === 'sources') {
+                // Cited sources, sent as soon as the answer cites them
+                setMessages(prev => prev.map(msg => 
+                  msg.id === aiMessageId 
+                    ? { ...msg, sources: data.sources }
+                    : msg
+                ))
               } else if (data.type === 'complete') {
                 // Mark as complete with sources
                 setMessages(prev => prev.map(msg => 
@@ -265,6 +284,9 @@ function App() {
                 onClick={() => {
                   setMessages([])
                   localStorage.removeItem('stockChatMessages')
+                  const id = crypto.randomUUID()
+                  localStorage.setItem('stockSessionId', id)
+                  setSessionId(id)
                 }}
                 className="text-sm text-gray-400 hover:text-white px-3 py-1 rounded-lg hover:bg-gray-800"
               >
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Conversation History Compaction
+
+Keeps per-thread message history - and with it the prompt - bounded in long
+conversations:
+
+- `prompt_history()` is what generate_ans sends: the newest whole turns that
+  fit the token budget, so prompt size stays flat even before compaction has
+  caught up. The rolling summary goes into the request's system prompt
+  (`summary_prompt()`) - Gemini only accepts a system message as the first
+  message, so it can't travel as a separate one inside the history
+- `HistoryCompactor.schedule()` runs after an answer, off the critical path:
+  once a thread's stored history passes `token_budget`, the older turns are
+  folded into the thread's `summary` by the `summarize` coroutine and removed
+  from the checkpoint (`RemoveMessage`), keeping the last `keep_messages`
+
+Every graph run or state update on a thread happens inside
+`HistoryCompactor.turn(thread_id)`, and compaction takes the same lock to
+read and to write. It reads the checkpoint of a finished turn and writes its
+result when no turn is running, so no turn can overwrite it with a state it
+loaded earlier. The summary itself is generated outside the lock, so the next
+question doesn't wait for it. Compaction is scheduled by the caller after the
+run, not from inside a node, and runs in an empty context. It doesn't inherit
+the request's callbacks, so its tokens never reach that request's event
+stream.
+
+Only human questions and AI answers are stored in `messages`; system prompts
+and retrieved context are built per request and never persisted.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import weakref
+
+from langchain_core.messages import HumanMessage, RemoveMessage
+
+from context_packer import estimate_tokens
+
+
+def history_tokens(messages) -> int:
+    return sum(estimate_tokens(str(m.content)) for m in messages)
+
+
+def _turn_start(messages, index: int) -> int:
+    """Move a cut point back so it never separates an answer from its question"""
+    while 0 < index < len(messages) and not isinstance(messages[index], HumanMessage):
+        index -= 1
+    return index
+
+
+def summary_prompt(summary: str) -> str:
+    """Rolling summary as a section to append to the request's system prompt"""
+    return f"\n\nSummary of the earlier conversation:\n{summary}\n" if summary else ""
+
+
+def prompt_history(messages, token_budget: int) -> list:
+    """The newest whole turns within token_budget"""
+    kept, used = len(messages), 0
+    for index in range(len(messages) - 1, -1, -1):
+        used += estimate_tokens(str(messages[index].content))
+        if used > token_budget:
+            break
+        kept = index
+    start = kept
+    while start < len(messages) and not isinstance(messages[start], HumanMessage):
+        start += 1  # don't open with an answer whose question was cut
+    return list(messages[start:])
+
+
+class HistoryCompactor:
+    """Background summarization of old turns, at most one run per thread at a time"""
+
+    def __init__(self, get_graph, summarize, token_budget: int = 2000, keep_messages: int = 4):
+        self.get_graph = get_graph
+        self.summarize = summarize  # async (previous summary, messages) -> new summary
+        self.token_budget = token_budget
+        self.keep_messages = keep_messages
+        self._running = {}  # thread_id -> asyncio.Task
+        self._locks = weakref.WeakValueDictionary()  # thread_id -> asyncio.Lock, gone once nobody holds it
+        self.compactions = 0
+        self.messages_removed = 0
+        self.failures = 0
+
+    def needs_compaction(self, messages) -> bool:
+        return len(messages) > self.keep_messages and history_tokens(messages) > self.token_budget
+
+    def _lock(self, thread_id) -> asyncio.Lock:
+        lock = self._locks.get(thread_id)
+        if lock is None:
+            lock = self._locks[thread_id] = asyncio.Lock()
+        return lock
+
+    @contextlib.asynccontextmanager
+    async def turn(self, thread_id):
+        """Hold the thread while a graph run or state update writes its checkpoints"""
+        async with self._lock(thread_id):
+            yield
+
+    def schedule(self, config, messages=None) -> None:
+        """Start compaction for the config's thread unless it is known to be under budget or already running.
+
+        Call after the turn has finished (outside `turn()`), never from inside a graph node. `messages` is
+        the finished turn's history (compacted as is); without it the thread's latest checkpoint is read."""
+        thread_id = config["configurable"]["thread_id"]
+        if messages is not None and not self.needs_compaction(messages):
+            return
+        task = self._running.get(thread_id)
+        if task is not None and not task.done():
+            return
+        # Empty context - the request's callbacks (and its event stream) don't follow the summary call
+        task = contextvars.Context().run(asyncio.ensure_future, self._compact(thread_id, messages))
+        self._running[thread_id] = task
+        task.add_done_callback(lambda t: self._forget(thread_id, t))
+
+    def _forget(self, thread_id, task):
+        if self._running.get(thread_id) is task:
+            del self._running[thread_id]
+        if not task.cancelled() and task.exception() is not None:
+            self.failures += 1
+
+    async def _compact(self, thread_id, messages=None) -> None:
+        graph = self.get_graph()
+        config = {"configurable": {"thread_id": thread_id}}
+        async with self.turn(thread_id):  # no turn is writing - this is the last finished turn's checkpoint
+            values = (await graph.aget_state(config)).values
+        if messages is None:
+            messages = values.get("messages", [])
+        if not self.needs_compaction(messages):
+            return
+        cut = _turn_start(messages, len(messages) - self.keep_messages)
+        old = messages[:cut]
+        if not old:
+            return
+        summary = await self.summarize(values.get("summary") or "", old)
+        async with self.turn(thread_id):
+            # Turns that finished meanwhile only appended - the old messages are still the oldest ones
+            current = {m.id for m in (await graph.aget_state(config)).values.get("messages", [])}
+            removed = [m for m in old if m.id in current]
+            await graph.aupdate_state(config, {
+                "summary": summary,
+                "messages": [RemoveMessage(id=m.id) for m in removed],
+            }, as_node="generate_answer")
+        self.compactions += 1
+        self.messages_removed += len(removed)
+
+    async def drain(self) -> None:
+        """Wait for running compactions (for short-lived event loops such as the CLI)"""
+        tasks = [task for task in self._running.values() if not task.done()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "compactions": self.compactions,
+            "messages_removed": self.messages_removed,
+            "failures": self.failures,
+            "in_progress": sum(1 for task in self._running.values() if not task.done()),
+            "token_budget": self.token_budget,
+        }
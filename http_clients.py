@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled HTTP Clients
+
+One long-lived `requests.Session` per upstream host, shared by every search in
+the process, so Tavily and Wikipedia calls reuse keep-alive connections instead
+of paying for a new TCP/TLS handshake each time.
+
+- `pool_size` connections are kept open per host; extra concurrent requests
+  still go out but their connections are closed afterwards (visible as
+  `connections_opened` growing past `pool_size` in `stats()`)
+- connection errors, read errors and 429/5xx responses are retried up to
+  `max_retries` times with exponential backoff capped at `backoff_max`
+- every request gets a (connect, read) timeout
+
+`PooledTavilyAPIWrapper` and `WikipediaClient` route the existing LangChain
+Tavily tool and the Wikipedia lookups through these clients.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from langchain_core.documents import Document
+from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+USER_AGENT = "BrowsingAgentAI/1.0 (stock market research assistant)"
+
+
+class PooledClient:
+    """Keep-alive session for one upstream with bounded retries and timeouts"""
+
+    def __init__(self, base_url: str, pool_size: int = 10, max_retries: int = 2, backoff: float = 0.3,
+                 backoff_max: float = 4.0, connect_timeout: float = 3.05, read_timeout: float = 10.0):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff,
+            backoff_max=backoff_max,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,  # searches are read-only, POST included
+            respect_retry_after_header=True,
+            raise_on_status=False,  # hand the last response to the caller's raise_for_status()
+        )
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.session.mount(self.base_url, self._adapter)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send through the pool; url may be a path relative to base_url"""
+        if not url.startswith(("http://", "https://")):
+            url = f"{self.base_url}{url}"
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self.requests += 1
+                self.errors += 1
+            raise
+        retry_state = getattr(response.raw, "retries", None)
+        with self._lock:
+            self.requests += 1
+            self.retries += len(retry_state.history) if retry_state is not None else 0
+            self.errors += response.status_code >= 400
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        pools = self._adapter.poolmanager.pools
+        in_use = idle = opened = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            in_use += pool.pool.maxsize - pool.pool.qsize()
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            opened += pool.num_connections
+        return {
+            "pool_size": self.pool_size,
+            "in_use": in_use,
+            "idle": idle,
+            "connections_opened": opened,
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+
+class PooledTavilyAPIWrapper(TavilySearchAPIWrapper):
+    """TavilySearchAPIWrapper sending its requests through a shared PooledClient"""
+
+    http: Any
+
+    def raw_results(self, query: str, max_results=5, search_depth="advanced", include_domains=[],
+                    exclude_domains=[], include_answer=False, include_raw_content=False,
+                    include_images=False) -> dict:
+        response = self.http.post("/search", json={
+            "api_key": self.tavily_api_key.get_secret_value(),
+            "query": query,
+            "max_results": max_results,
+            "search_depth": search_depth,
+            "include_domains": include_domains,
+            "exclude_domains": exclude_domains,
+            "include_answer": include_answer,
+            "include_raw_content": include_raw_content,
+            "include_images": include_images,
+        })
+        response.raise_for_status()
+        return response.json()
+
+    async def raw_results_async(self, query: str, **kwargs) -> dict:
+        # the stock wrapper opens a new aiohttp session per call - reuse the pool instead
+        return await asyncio.to_thread(self.raw_results, query, **kwargs)
+
+
+class WikipediaClient:
+    """Wikipedia search + page extracts over a PooledClient, returning WikipediaLoader-style Documents"""
+
+    def __init__(self, http: PooledClient, doc_content_chars_max: int = 4000):
+        self.http = http
+        self.doc_content_chars_max = doc_content_chars_max
+        self._executor = ThreadPoolExecutor(max_workers=http.pool_size, thread_name_prefix="wikipedia")
+
+    def _query(self, params: dict) -> dict:
+        response = self.http.get("/w/api.php", params={"action": "query", "format": "json", **params})
+        response.raise_for_status()
+        return response.json()
+
+    def search(self, query: str, limit: int) -> list:
+        data = self._query({"list": "search", "srsearch": query[:300], "srlimit": limit, "srprop": ""})
+        return [result["title"] for result in data.get("query", {}).get("search", [])]
+
+    def page(self, title: str):
+        """Plain-text article as a Document; None for missing and disambiguation pages"""
+        data = self._query({
+            "prop": "extracts|info|pageprops", "explaintext": 1, "inprop": "url",
+            "ppprop": "disambiguation", "redirects": 1, "titles": title,
+        })
+        for page in data.get("query", {}).get("pages", {}).values():
+            if "missing" in page or "disambiguation" in page.get("pageprops", {}):
+                return None
+            content = page.get("extract") or ""
+            return Document(
+                page_content=content[:self.doc_content_chars_max],
+                metadata={
+                    "title": title,
+                    "summary": content.split("\n==")[0].strip(),
+                    "source": page["fullurl"],
+                    "revision_id": page.get("lastrevid"),
+                },
+            )
+        return None
+
+    def load(self, query: str, max_docs: int = 6) -> list:
+        """Blocking - search, then fetch the matching pages in parallel over the pool"""
+        titles = self.search(query, max_docs)
+        return [doc for doc in self._executor.map(self.page, titles[:max_docs]) if doc is not None]
+
+    def revisions(self, titles: list) -> dict:
+        """Latest revision id per title, one batched API call"""
+        if not titles:
+            return {}
+        pages = self._query({"prop": "info", "titles": "|".join(titles)}).get("query", {}).get("pages", {})
+        return {p["title"]: p.get("lastrevid") for p in pages.values() if "lastrevid" in p}
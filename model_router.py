@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Model Routing
+
+Picks the Gemini tier for every LLM call from the node making it and, for
+answers, the kind of question - the same SIMPLE / ANALYSIS / FOLLOW-UP split
+the answer prompt already makes:
+
+- flash: the search classifier, history summaries, simple lookups (price,
+  P/E, market cap), follow-ups and general questions
+- pro: analysis (buy/sell/hold, outlook, comparisons of several stocks)
+
+Routes and model names are configurable (`parse_routes()` reads
+"check=flash,generate_answer.analysis=pro" style specs). Every call's
+latency and token usage is recorded per tier and node.
+"""
+
+import re
+import threading
+
+from search_cache import normalize_question
+from search_classifier import FOLLOW_UP_RE
+
+FLASH = "flash"
+PRO = "pro"
+
+DEFAULT_ROUTES = {
+    "check": FLASH,
+    "summarize": FLASH,
+    "generate_answer.simple": FLASH,
+    "generate_answer.follow_up": FLASH,
+    "generate_answer.general": FLASH,
+    "generate_answer.analysis": PRO,
+}
+
+ANALYSIS_RE = re.compile(
+    r"\b(should i|buy|sell|hold|invest(ing|ment)?|analy[sz](e|is)|recommend(ation)?|outlook|forecast|"
+    r"predict(ion)?|compare|comparison|vs|versus|better|overvalued|undervalued|target|risks?|"
+    r"long term|short term|strategy|portfolio|bull(ish)? case|bear(ish)? case|worth buying)\b"
+)
+SIMPLE_RE = re.compile(
+    r"\b(price|quote|trading at|p ?e|pe ratio|market cap|eps|dividend|yield|volume|52 week|"
+    r"close[ds]?|closing|open(ed|ing)?|high|low|revenue|shares outstanding|beta|ticker)\b"
+)
+
+
+def question_class(question: str, entities=None) -> str:
+    """simple / analysis / follow_up / general"""
+    text = normalize_question(question)
+    if ANALYSIS_RE.search(text) or len(entities or []) > 1:
+        return "analysis"
+    if FOLLOW_UP_RE.search(text):
+        return "follow_up"
+    if SIMPLE_RE.search(text):
+        return "simple"
+    return "general"
+
+
+def parse_routes(spec: str) -> dict:
+    """"node[.class]=tier,..." -> routes (on top of DEFAULT_ROUTES)"""
+    routes = dict(DEFAULT_ROUTES)
+    for item in (spec or "").split(","):
+        if "=" in item:
+            key, tier = item.split("=", 1)
+            routes[key.strip()] = tier.strip()
+    return routes
+
+
+class ModelRouter:
+    """Tier per (node, question class) plus per-tier latency and token accounting"""
+
+    def __init__(self, models: dict, routes: dict = None, default_tier: str = PRO):
+        self.models = models  # tier -> model name
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+        self.default_tier = default_tier
+        self._lock = threading.Lock()
+        self._usage = {}  # (tier, node) -> [calls, seconds, input tokens, output tokens]
+
+    def tier(self, node: str, question_class: str = None) -> str:
+        tier = self.routes.get(f"{node}.{question_class}") if question_class else None
+        tier = tier or self.routes.get(node) or self.default_tier
+        return tier if tier in self.models else self.default_tier
+
+    def model(self, tier: str) -> str:
+        return self.models[tier]
+
+    def record(self, tier: str, node: str, seconds: float, input_tokens: int = 0, output_tokens: int = 0) -> None:
+        with self._lock:
+            usage = self._usage.setdefault((tier, node), [0, 0.0, 0, 0])
+            usage[0] += 1
+            usage[1] += seconds
+            usage[2] += input_tokens
+            usage[3] += output_tokens
+
+    def usage(self) -> dict:
+        """(tier, node) -> {"calls", "seconds", "input_tokens", "output_tokens"}"""
+        with self._lock:
+            return {
+                key: {"calls": calls, "seconds": seconds, "input_tokens": input_tokens, "output_tokens": output_tokens}
+                for key, (calls, seconds, input_tokens, output_tokens) in self._usage.items()
+            }
+
+    def stats(self) -> dict:
+        tiers = {
+            tier: {"model": model, "calls": 0, "avg_latency_ms": 0.0, "input_tokens": 0, "output_tokens": 0, "nodes": {}}
+            for tier, model in self.models.items()
+        }
+        for (tier, node), usage in self.usage().items():
+            entry = tiers.setdefault(tier, {"model": None, "calls": 0, "avg_latency_ms": 0.0,
+                                            "input_tokens": 0, "output_tokens": 0, "nodes": {}})
+            entry["nodes"][node] = usage["calls"]
+            entry["input_tokens"] += usage["input_tokens"]
+            entry["output_tokens"] += usage["output_tokens"]
+            entry["avg_latency_ms"] += usage["seconds"]  # summed here, averaged below
+            entry["calls"] += usage["calls"]
+        for entry in tiers.values():
+            entry["avg_latency_ms"] = round(entry["avg_latency_ms"] / entry["calls"] * 1000, 1) if entry["calls"] else 0.0
+        return {"tiers": tiers, "routes": dict(self.routes)}
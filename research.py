@@ -14,30 +14,41 @@ Original file is located at
 
 import os
 import getpass
+import asyncio
+import time
+import uuid
 import dotenv
 from datetime import datetime, timedelta
 dotenv.load_dotenv()
-os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
+# GOOGLE_API_KEY comes from .env - it is only needed once the LLM is first used
+from functools import lru_cache
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-1.5-pro-latest",  # ✅ or any other from model list
-    temperature=0.7  # You can adjust this
+# Model tier per node / question class - flash takes the classifier, summaries and simple lookups, pro the analysis
+from model_router import FLASH, PRO, ModelRouter, parse_routes, question_class
+model_router = ModelRouter(
+    {
+        FLASH: os.getenv("GEMINI_FLASH_MODEL", "gemini-1.5-flash-latest"),
+        PRO: os.getenv("GEMINI_PRO_MODEL", "gemini-1.5-pro-latest"),  # ✅ or any other from model list
+    },
+    parse_routes(os.getenv("MODEL_ROUTES", "")),
 )
 
-res= llm.invoke("test")
-res.content
-
-res= llm.invoke("True if the user's question requires external search like browser to answer, False otherwise. : what is pervious question i asked ")
-res.content
+@lru_cache(maxsize=None)
+def get_llm(tier=PRO):
+    """Gemini client for a model tier, created on first use (importing this module makes no network calls)"""
+    return ChatGoogleGenerativeAI(
+        model=model_router.model(tier),
+        temperature=0.7  # You can adjust this
+    )
 
 from typing import List
 from typing_extensions import TypedDict
 from langgraph.graph import START, MessagesState, StateGraph
 from pydantic import BaseModel, Field
 import operator
-from typing import Annotated
+from typing import Annotated, Union
 
 
 
@@ -46,11 +57,18 @@ class SearchDecision(BaseModel):
         description="True if the user's question requires external search to answer, False otherwise."
     )
 
+from turn_context import merge_context, reset_context
+# Characters of previous-turn context carried into the next question (0 = none)
+CONTEXT_CARRY_OVER_CHARS = int(os.getenv("CONTEXT_CARRY_OVER_CHARS", "0"))
+
 class Researchstate(MessagesState):
   question:str
   answer:str
-  context: Annotated[list, operator.add]
+  context: Annotated[list, merge_context]  # scoped to the current turn, see turn_context.py
   needs_search: bool
+  summary: str  # rolling summary of turns compacted out of messages, see history.py
+  entities: list  # [{"ticker", "name"}] mentioned in the current question, see symbols.py
+  sources: list  # URLs the current answer cited, see citations.py
 
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.messages import AIMessage
@@ -82,11 +100,66 @@ Remember: For stock information, we almost always need fresh, live data from ext
 ]
 
 
-def check(state):
+# Local ticker / company-name index - questions are keyed on canonical tickers (SYMBOL_LISTINGS_PATH="" disables it)
+from symbols import SymbolIndex
+SYMBOL_LISTINGS_PATH = os.getenv(
+    "SYMBOL_LISTINGS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "listings.csv")
+)
+symbol_index = SymbolIndex(SYMBOL_LISTINGS_PATH or None)
+
+# Every Gemini / Tavily / Wikipedia call waits for its provider's rate limit (requests per second, burst)
+from upstream_scheduler import BATCH, UpstreamScheduler, caller
+upstream = UpstreamScheduler(
+    {
+        "gemini": (float(os.getenv("GEMINI_RATE_LIMIT", "5")), float(os.getenv("GEMINI_BURST", "10"))),
+        "tavily": (float(os.getenv("TAVILY_RATE_LIMIT", "5")), float(os.getenv("TAVILY_BURST", "10"))),
+        "wikipedia": (float(os.getenv("WIKIPEDIA_RATE_LIMIT", "20")), float(os.getenv("WIKIPEDIA_BURST", "40"))),
+    },
+    max_queue=int(os.getenv("UPSTREAM_QUEUE_SIZE", "256")),
+)
+
+from search_classifier import SearchClassifier
+search_classifier = SearchClassifier(
+    memo_size=int(os.getenv("CLASSIFIER_MEMO_SIZE", "2048")),
+    fast_path=os.getenv("CLASSIFIER_FAST_PATH", "true").lower() in ("1", "true", "yes"),
+)
+
+from speculation import Speculation
+speculation = Speculation(enabled=os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() in ("1", "true", "yes"))
+
+async def check(state, config):
   question = state["question"]
-  decision_model = llm.with_structured_output(SearchDecision)
-  decision = decision_model.invoke(search_classifier_prompt + [HumanMessage(content=question)])
-  return {"needs_search": decision.needs_search,
+  entities = symbol_index.extract(question)
+  # Clear cases (and questions seen before) are decided locally - the LLM only gets the rest
+  needs_search = search_classifier.classify(question, entities)
+  if needs_search is None:
+    # Retrieval starts now and overlaps the classifier call - thrown away if no search is needed
+    speculation_key = speculation.key(config, question)
+    speculative_state = {**state, "entities": entities}
+    speculation.start(speculation_key, {
+        "search_web": lambda: search_web(speculative_state, config),
+        "search_wikipedia": lambda: search_wiki(speculative_state, config),
+    })
+    try:
+      await upstream.acquire("gemini", *caller(config))
+      tier = model_router.tier("check")
+      decision_model = get_llm(tier).with_structured_output(SearchDecision)
+      classifier_messages = search_classifier_prompt + [HumanMessage(content=question)]
+      started = time.perf_counter()
+      decision = await decision_model.ainvoke(classifier_messages)
+      # Structured output carries no usage metadata - estimate from the prompt and the decision
+      model_router.record(tier, "check", time.perf_counter() - started,
+                          estimate_tokens("".join(m.content for m in classifier_messages)), estimate_tokens(str(decision)))
+    except BaseException:
+      speculation.discard(speculation_key)
+      raise
+    needs_search = decision.needs_search
+    search_classifier.record_llm(question, needs_search)
+    if not needs_search:
+      speculation.discard(speculation_key)
+  return {"needs_search": needs_search,
+          "entities": entities,
+          "context": reset_context(CONTEXT_CARRY_OVER_CHARS),  # new turn - drop last question's retrieval
           "messages": state["messages"]
 }
 
@@ -94,57 +167,214 @@ import os
 os.environ["TAVILY_API_KEY"] = "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"
 
 from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_community.document_loaders import WikipediaLoader
-tavily_search = TavilySearchResults(max_results=3)
 
-def search_web(state):
+# One keep-alive connection pool per upstream, shared by every search in the process
+from http_clients import PooledClient, PooledTavilyAPIWrapper, WikipediaClient
+HTTP_OPTIONS = dict(
+    max_retries=int(os.getenv("HTTP_MAX_RETRIES", "2")),
+    backoff=float(os.getenv("HTTP_BACKOFF", "0.3")),
+    backoff_max=float(os.getenv("HTTP_BACKOFF_MAX", "4")),
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")),
+    read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "10")),
+)
+tavily_http = PooledClient("https://api.tavily.com", pool_size=int(os.getenv("TAVILY_POOL_SIZE", "10")), **HTTP_OPTIONS)
+wikipedia_http = PooledClient("https://en.wikipedia.org", pool_size=int(os.getenv("WIKIPEDIA_POOL_SIZE", "10")), **HTTP_OPTIONS)
+wikipedia_client = WikipediaClient(wikipedia_http)
+
+@lru_cache(maxsize=None)
+def get_tavily_search():
+    """Tavily search tool, created on first use and shared by every search"""
+    return TavilySearchResults(max_results=6, api_wrapper=PooledTavilyAPIWrapper(http=tavily_http))
+
+# Prompt context budget - retrieved documents are ranked per passage and packed up to this size
+from context_packer import estimate_tokens, pack_context
+from citations import CitationTable, CitationTracker
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_PASSAGE_WORDS = int(os.getenv("CONTEXT_PASSAGE_WORDS", "120"))
+# Syndicated copies of a story (and pages both retrievers found) reach the prompt once
+from dedup import DocumentDeduplicator
+deduplicator = DocumentDeduplicator(threshold=float(os.getenv("DEDUP_SIMILARITY", "0.8")))
+
+# Per-source deadlines (seconds) - web and Wikipedia run in parallel and the answer
+# goes ahead with whatever came back in time
+SEARCH_WEB_TIMEOUT = float(os.getenv("SEARCH_WEB_TIMEOUT", "8"))
+SEARCH_WIKI_TIMEOUT = float(os.getenv("SEARCH_WIKI_TIMEOUT", "5"))
+
+# Shared SQLite store for sessions and caches - lets several worker processes serve the same
+# sessions and survives restarts (unset = everything stays in this process's memory)
+STATE_DB_PATH = os.getenv("STATE_DB_PATH") or None
+
+# Tavily results are reused for everyone asking the same question inside one freshness bucket
+from search_cache import SearchCache, normalize_question
+search_cache = SearchCache(
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "300")),
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512")),
+    path=os.getenv("SEARCH_CACHE_PATH") or STATE_DB_PATH,
+)
+
+# Wikipedia articles barely change - keep them in a local document store (WIKI_CACHE_PATH="" disables it)
+from wiki_store import WikiStore
+WIKI_CACHE_PATH = os.getenv("WIKI_CACHE_PATH", "wiki_cache.db")
+
+@lru_cache(maxsize=None)
+def get_wiki_store():
+    """Wikipedia document store, opened on first use (importing this module creates no files)"""
+    if not WIKI_CACHE_PATH:
+        return None
+    return WikiStore(
+        WIKI_CACHE_PATH,
+        ttl=float(os.getenv("WIKI_CACHE_TTL", str(7 * 24 * 3600))),
+        max_bytes=int(float(os.getenv("WIKI_CACHE_MAX_MB", "200")) * 1024 * 1024),
+        revalidate=os.getenv("WIKI_CACHE_REVALIDATE", "false").lower() in ("1", "true", "yes"),
+        client=wikipedia_client,
+    )
+
+# Conversation history - the prompt carries a rolling summary plus the newest turns within this budget;
+# older turns are summarized in the background once the stored history grows past it
+from history import HistoryCompactor, prompt_history, summary_prompt
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+
+history_summary_prompt = SystemMessage(content="""
+You maintain a running summary of a conversation between a user and a stock market research assistant.
+Merge the current summary with the new conversation turns into one updated summary of at most 200 words.
+Keep the stocks and tickers discussed, key figures and dates quoted, recommendations given and open questions.
+Return only the summary.
+""")
+
+async def summarize_history(previous_summary, messages):
+  """Fold older turns into the thread's rolling summary (runs in the background)"""
+  await upstream.acquire("gemini", BATCH, "history-compaction")
+  transcript = "\n".join(f"{m.type}: {m.content}" for m in messages)
+  summary_messages = [history_summary_prompt, HumanMessage(
+      content=f"Current summary:\n{previous_summary or '(none)'}\n\nNew conversation turns:\n{transcript}"
+  )]
+  tier = model_router.tier("summarize")
+  started = time.perf_counter()
+  response = await get_llm(tier).ainvoke(summary_messages)
+  usage = getattr(response, "usage_metadata", None) or {}
+  model_router.record(tier, "summarize", time.perf_counter() - started,
+                      usage.get("input_tokens") or estimate_tokens("".join(m.content for m in summary_messages)),
+                      usage.get("output_tokens") or estimate_tokens(response.content))
+  return response.content
+
+history_compactor = HistoryCompactor(
+    lambda: get_graph(),
+    summarize_history,
+    token_budget=HISTORY_TOKEN_BUDGET,
+    keep_messages=int(os.getenv("HISTORY_KEEP_MESSAGES", "4")),
+)
+
+# Concurrent identical retrievals (e.g. a watchlist batch) share one upstream call
+from single_flight import SingleFlight
+retrieval_flights = SingleFlight()
+
+async def load_wiki_docs(query, max_docs, config):
+  """Wikipedia lookup backed by the local document store"""
+  who = caller(config)
+  loop = asyncio.get_running_loop()
+  def acquire(cost):
+    # Revision checks run on the store's worker thread - they wait for the same rate limit on the loop
+    asyncio.run_coroutine_threadsafe(upstream.acquire("wikipedia", *who, cost=cost), loop).result()
+  # The Wikipedia client and the SQLite store are blocking - keep them off the event loop
+  wiki_store = await asyncio.to_thread(get_wiki_store)
+  if wiki_store is not None:
+    docs = await asyncio.to_thread(wiki_store.get, query, acquire)
+    if docs is not None:
+      return docs
+  await upstream.acquire("wikipedia", *who, cost=1 + max_docs)  # one search + one request per page
+  docs = await asyncio.to_thread(wikipedia_client.load, query, max_docs)
+  if wiki_store is not None:
+    await asyncio.to_thread(wiki_store.put, query, docs, acquire)
+  return docs
+
+async def search_web(state, config):
   """retrives docs from web search """
-  tavily_search=TavilySearchResults(max_results=6)
   now = datetime.now()
   three_days_ago = now - timedelta(days=3)
     
   now_str = now.strftime('%Y-%m-%d %H:%M')
   past_str = three_days_ago.strftime('%Y-%m-%d %H:%M')
   original_question = state["question"]
+  companies = "; ".join(f"{e['name']} ({e['ticker']})" for e in state.get("entities") or [])
   enhanced_query = (
-        f"{original_question} updates, prices, or news from {past_str} to {now_str}, "
+        f"{original_question} {'[' + companies + '] ' if companies else ''}updates, prices, or news from {past_str} to {now_str}, "
         f"latest market activity, recent performance past 72 hours"
     )
   print(enhanced_query)
-  search_docs= tavily_search.invoke(enhanced_query)
+  # "AAPL price" and "what's the price of Apple stock?" share one cache entry
+  cache_key = search_cache.make_key(symbol_index.canonical_question(original_question))
+  search_docs = await search_cache.aget(cache_key)
+  if search_docs is None:
+    async def call():
+      await upstream.acquire("tavily", *caller(config))
+      return await get_tavily_search().ainvoke(enhanced_query)
+    async def fetch():
+      docs = await asyncio.wait_for(call(), timeout=SEARCH_WEB_TIMEOUT)  # queueing counts against the deadline
+      if isinstance(docs, str):  # the tool reports provider errors as a string - don't cache them
+        raise RuntimeError(docs)
+      await search_cache.aset(cache_key, docs)
+      return docs
+    try:
+      search_docs= await retrieval_flights.run(("web", cache_key), fetch)
+    except Exception as e:  # deadline or provider error - don't hold up the answer
+      print(f"⚠️ Web search skipped: {e!r}")
+      return {"context":[]}
   
 
 
 
 
-  formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document href="{doc["url"]}">\n{doc["content"]}\n\n**SOURCE URL: {doc["url"]}**\n</Document>'
-            for doc in search_docs
-        ]
-    )
-  return {"context":[formatted_search_docs]}
+  # Raw documents - generate_ans packs the relevant passages into the prompt
+  return {"context":[
+      {"url": doc["url"], "title": doc.get("title", ""), "content": doc["content"], "source": "web"}
+      for doc in search_docs
+  ]}
 
-def search_wiki(state):
+async def search_wiki(state, config):
   """retrives docs from wiki search """
-  search_docs= WikipediaLoader( query= state["question"],load_max_docs=6).load()
-  formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}">\n{doc.page_content}\n\n**SOURCE URL: {doc.metadata["source"]}**\n</Document>'
-            for doc in search_docs
-        ]
+  try:
+    question = state["question"]
+    # Named companies are looked up by their article title, which every phrasing shares
+    entities = state.get("entities") or []
+    queries = [(e["name"], max(1, 6 // len(entities))) for e in entities] or [(question, 6)]
+    results = await asyncio.wait_for(
+        asyncio.gather(*(
+            retrieval_flights.run(("wiki", normalize_question(query), max_docs),
+                                  lambda query=query, max_docs=max_docs: load_wiki_docs(query, max_docs, config))
+            for query, max_docs in queries
+        )),
+        timeout=SEARCH_WIKI_TIMEOUT,
     )
-  return {"context":[formatted_search_docs]}
-
-def generate_ans(state, stream=False):
-  """node to answer a question with optional streaming support"""
-  context= state["context"]
+    search_docs = list({doc.metadata["source"]: doc for docs in results for doc in docs}.values())
+  except Exception as e:  # deadline or provider error - don't hold up the answer
+    print(f"⚠️ Wikipedia search skipped: {e!r}")
+    return {"context":[]}
+  return {"context":[
+      {"url": doc.metadata["source"], "title": doc.metadata.get("title", ""), "content": doc.page_content, "source": "wikipedia"}
+      for doc in search_docs
+  ]}
+
+async def generate_ans(state, config):
+  """node to answer a question, printing the answer as it streams"""
   question= state["question"]
+  # Only the passages most relevant to the question, within the prompt token budget,
+  # labelled with short citation ids the answer refers to as [n]
+  citations = CitationTracker(CitationTable())
+  documents, duplicates = deduplicator.dedupe(state["context"])
+  if duplicates["documents_removed"]:
+    print(f"🧹 Skipped {duplicates['documents_removed']} duplicate documents ({duplicates['chars_removed']} characters)")
+  context= pack_context(question, documents, CONTEXT_TOKEN_BUDGET, CONTEXT_PASSAGE_WORDS, citations.table)
   needs_search= state["needs_search"]
-  messages = state.get("messages", [])
+  # Newest turns + the rolling summary in the system prompt - prompt size stays flat however long the conversation gets
+  history = prompt_history(state.get("messages", []), HISTORY_TOKEN_BUDGET)
+  summary = summary_prompt(state.get("summary", ""))
 
-  # Initialize variables for streaming
+  # Simple lookups, follow-ups and general questions go to the flash model, analysis to pro
+  tier = model_router.tier("generate_answer", question_class(question, state.get("entities")))
+  await upstream.acquire("gemini", *caller(config))
   full_response = ""
+  started = time.perf_counter()
+  usage = {}
 
   if needs_search:
     print("📈 Fetching live stock market data...")
@@ -164,80 +394,71 @@ Your response should include:
 5. **Investment Recommendation**: BUY/HOLD/SELL with clear reasoning
 6. **Risk Assessment**: Potential risks and opportunities
 7. **Price Targets**: Short-term and long-term projections if possible
-8. **Sources**: Include all source links at the end for verification
+8. **Sources**: Cite the documents you use inline by their id in square brackets, e.g. [1] or [2][5]
 
 Use LIVE, UP-TO-DATE information from the provided context. Be specific with numbers, dates, and sources.
 Prioritize getting TODAY'S closing price or the most recent available closing price.
 Format your response clearly with headers and bullet points for easy reading.
 
-IMPORTANT: At the end of your response, include only some best 6 "📚 Sources:" section with all the URLs and links from the provided context so users can verify the information and read more details.
-""")
-    messages = messages+[system_message]
-    
+IMPORTANT: Do not write out URLs or a sources list - the cited documents' links are added after your answer.
+{summary}""")
     # Stream the response
-    if not stream:
-        print("\n📊 Stock Analyst: ", end="", flush=True)
+    print("\n📊 Stock Analyst: ", end="", flush=True)
     
-    for chunk in llm.stream([
-        messages,
+    # The system prompt must come first - Gemini rejects a system message anywhere else
+    final_messages = [system_message] + history + [
         HumanMessage(content="Provide comprehensive stock analysis and recommendations.")
-    ]):
+    ]
+    async for chunk in get_llm(tier).astream(final_messages):
         if chunk.content:
-            if stream:
-                # For backend streaming - yield chunks as they come
-                yield chunk.content
-            else:
-                # For console/regular use - print and accumulate
-                print(chunk.content, end="", flush=True)
+            print(chunk.content, end="", flush=True)
             full_response += chunk.content
+            citations.feed(chunk.content)
+        for kind, count in (getattr(chunk, "usage_metadata", None) or {}).items():
+            usage[kind] = max(usage.get(kind, 0), count)
     
-    if not stream:
-        print()  # New line after streaming
+    print(citations.footer())  # New line after streaming
     
   else:
     print("💬 Using previous stock discussion...")
     # Add stock context to conversation-based responses
-    stock_context_message = SystemMessage(content="""
+    stock_context_message = SystemMessage(content=f"""
 You are a Stock Market Expert. When answering questions about previous conversations, 
 maintain your role as a financial advisor. Keep responses focused on stock market topics,
 investment advice, and financial analysis. Be helpful and professional.
-""")
+{summary}""")
     human_message = HumanMessage(content=question)
-    messages = [stock_context_message] + messages + [human_message]
-    
     # Stream the response
-    if not stream:
-        print("\n📊 Stock Analyst: ", end="", flush=True)
+    print("\n📊 Stock Analyst: ", end="", flush=True)
     
-    for chunk in llm.stream(messages):
+    final_messages = [stock_context_message] + history + [human_message]
+    async for chunk in get_llm(tier).astream(final_messages):
         if chunk.content:
-            if stream:
-                # For backend streaming - yield chunks as they come
-                yield chunk.content
-            else:
-                # For console/regular use - print and accumulate
-                print(chunk.content, end="", flush=True)
+            print(chunk.content, end="", flush=True)
             full_response += chunk.content
+        for kind, count in (getattr(chunk, "usage_metadata", None) or {}).items():
+            usage[kind] = max(usage.get(kind, 0), count)
     
-    if not stream:
-        print()  # New line after streaming
-
-  if stream:
-    # For streaming, return the final state
-    return {
-        "answer": full_response,
-        "messages": messages + [AIMessage(content=full_response)]
-    }
-  else:
-    # For regular use, return immediately
-    return {
-        "answer": full_response,  # get the full streamed response
-        "messages": messages + [AIMessage(content=full_response)]
-    }
-
-def route_based_on_search(state) -> str:
+    print()  # New line after streaming
+
+  model_router.record(tier, "generate_answer", time.perf_counter() - started,
+                      usage.get("input_tokens") or estimate_tokens("".join(str(m.content) for m in final_messages)),
+                      usage.get("output_tokens") or estimate_tokens(full_response))
+  # Links of the documents the answer cited
+  full_response += citations.footer()
+
+  # Only the question and answer are stored - prompts and retrieved context stay out of the checkpoint
+  turn = [HumanMessage(content=question), AIMessage(content=full_response)]
+  return {
+      "answer": full_response,
+      "sources": citations.sources(),
+      "messages": turn
+  }
+
+def route_based_on_search(state) -> Union[str, List[str]]:
     if state.get("needs_search"):
-        return "search_web"
+        # Fan out - both retrievers run in the same step and merge through the context reducer
+        return ["search_web", "search_wikipedia"]
     else:
         return "generate_answer"
 
@@ -250,35 +471,55 @@ from langchain_core.messages import HumanMessage ,SystemMessage
 from langgraph.checkpoint.memory import MemorySaver
 
 
-memory=MemorySaver()
+# Bounded per-session storage - idle threads are evicted and only the latest checkpoints kept
+from checkpointer import BoundedMemorySaver, SqliteCheckpointSaver
+session_limits = dict(
+    max_threads=int(os.getenv("MAX_SESSIONS", "1000")),
+    max_checkpoints_per_thread=int(os.getenv("MAX_CHECKPOINTS_PER_SESSION", "5")),
+    idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "3600")),
+)
+memory = SqliteCheckpointSaver(STATE_DB_PATH, **session_limits) if STATE_DB_PATH else BoundedMemorySaver(**session_limits)
 
 
-builder = StateGraph(Researchstate)
+@lru_cache(maxsize=None)
+def get_graph():
+    """Build and compile the research graph on first use"""
+    builder = StateGraph(Researchstate)
 
-builder.add_node("check",check)
+    builder.add_node("check",check)
 
-# Initialize each node with node_secret
-builder.add_node("search_web",search_web)
-builder.add_node("search_wikipedia", search_wiki)
-builder.add_node("generate_answer", generate_ans)
+    # Initialize each node with node_secret
+    # Retrieval nodes pick up what check started speculatively, see speculation.py
+    builder.add_node("search_web", speculation.node("search_web", search_web))
+    builder.add_node("search_wikipedia", speculation.node("search_wikipedia", search_wiki))
+    builder.add_node("generate_answer", generate_ans)
 
-# Flow
-builder.add_edge(START, "check")
-builder.add_conditional_edges(
-    "check",                    # the current node name
-    route_based_on_search,      # your routing function
-    ["search_web", "generate_answer"]  # possible destinations
-)
-builder.add_edge("search_web", "search_wikipedia")
-builder.add_edge("search_wikipedia", "generate_answer")
-builder.add_edge("generate_answer", END)
-graph = builder.compile(checkpointer=memory)
+    # Flow
+    builder.add_edge(START, "check")
+    builder.add_conditional_edges(
+        "check",                    # the current node name
+        route_based_on_search,      # your routing function
+        ["search_web", "search_wikipedia", "generate_answer"]  # possible destinations
+    )
+    builder.add_edge(["search_web", "search_wikipedia"], "generate_answer")
+    builder.add_edge("generate_answer", END)
+    return builder.compile(checkpointer=memory)
+
+# display(Image(get_graph().get_graph().draw_mermaid_png()))
 
-# display(Image(graph.get_graph().draw_mermaid_png()))
+async def ask(question, config):
+    """One CLI turn - waits for history compaction so asyncio.run() doesn't cancel it"""
+    async with history_compactor.turn(config["configurable"]["thread_id"]):
+        result = await get_graph().ainvoke({"question": question}, config=config)
+    # Compaction starts once the turn is checkpointed
+    history_compactor.schedule(config, result.get("messages"))
+    await history_compactor.drain()
+    return result
 
 def main():
     """Main interactive function to get user input and process stock questions"""
-    config = {"configurable": {"thread_id": "stock_session"}}
+    # One conversation thread per CLI run
+    config = {"configurable": {"thread_id": f"cli-{uuid.uuid4().hex}"}}
     
     print("📈 Welcome to the Live Stock Market Research Assistant!")
     print("🔴 LIVE MARKET DATA | 📊 EXPERT ANALYSIS | 💡 INVESTMENT RECOMMENDATIONS")
@@ -309,7 +550,7 @@ def main():
             print("-" * 60)
             
             # Process the question through the graph
-            result = graph.invoke({"question": user_question}, config=config)
+            result = asyncio.run(ask(user_question, config))
             
             # The streaming already happened in generate_ans, so we just need to show completion
             print(f"\n✅ Analysis completed!")
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Search Result Cache
+
+Time-bucketed TTL cache for Tavily search results. Keys are built from the
+normalized question plus a freshness bucket, so everyone asking about the same
+ticker inside one bucket shares a single web search.
+
+Two tiers:
+- in-memory LRU (always on)
+- optional on-disk SQLite tier, shared across restarts and worker processes
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import shared_db
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    question = re.sub(r"[^\w\s$.]", " ", question.lower().replace("'", ""))
+    question = re.sub(r"(?<!\w)\.|\.(?!\w)", " ", question)  # keep dots inside tickers like BRK.B
+    return " ".join(question.split())
+
+
+class SearchCache:
+    """In-memory LRU with an optional SQLite tier, both bounded by the same TTL"""
+
+    def __init__(self, ttl: float = 300, max_entries: int = 512, path: str = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            self._db = shared_db.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def make_key(self, question: str, now: float = None) -> str:
+        """Normalized question + freshness bucket (one bucket per TTL window)"""
+        now = time.time() if now is None else now
+        bucket = int(now // self.ttl) if self.ttl > 0 else 0
+        return f"{normalize_question(question)}|{bucket}"
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+                self._db.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+
+    async def aget(self, key: str):
+        """get() for coroutines - the SQLite tier is read on a worker thread, off the event loop"""
+        if self._db is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value) -> None:
+        if self._db is None:
+            self.set(key, value)
+        else:
+            await asyncio.to_thread(self.set, key, value)
+
+    def _remember(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._memory),
+            "ttl_seconds": self.ttl,
+        }
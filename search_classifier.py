@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Search Decision Fast Path
+
+Local classifier in front of the `check` node's structured-output Gemini call.
+Clear cases are decided in-process:
+- greetings, thanks and questions about the conversation itself -> no search
+- tickers, listed company names (via the symbol index), prices, earnings,
+  news, buy/sell and other market terms -> search
+
+Anything ambiguous (both or neither kind of signal) returns None and goes to
+the LLM. Every decision is memoized on the normalized question, and the path
+taken (fast / memo / llm) is counted.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+from search_cache import normalize_question
+
+_SMALL_TALK = (
+    r"(hi|hello|hey|yo|hiya|howdy|thanks?|thank you( so much| very much)?|thx|ty|ok(ay)?|cool|great|nice|"
+    r"bye|goodbye|see you|good (morning|afternoon|evening|night)|how are you( doing)?( today)?|who are you|"
+    r"what can you do|help)( there)?( bot| assistant)?"
+)
+SMALL_TALK_RE = re.compile(rf"^{_SMALL_TALK}( {_SMALL_TALK})*$")
+FOLLOW_UP_RE = re.compile(
+    r"\b(what did i (just )?ask|previous (question|answer|message)|last (question|answer|message)|"
+    r"you (just )?(said|mentioned|told)|earlier (question|answer)|what do you mean|explain (that|this|it)( again)?|"
+    r"(can you )?(repeat|summari[sz]e) (that|this|it)|which stock did i|what stock did i)\b"
+)
+MARKET_TERMS_RE = re.compile(
+    r"\b(stocks?|shares?|price[sd]?|pricing|quote|trading|traded|market ?cap|earnings|eps|revenue|profit|"
+    r"guidance|dividends?|yield|p ?e|pe ratio|valuation|news|latest|today|now|current(ly)?|recent|"
+    r"buy|sell|hold|invest(ing|ment)?|analy[sz](e|is)|forecast|outlook|target|compare|vs|versus|"
+    r"ipo|etf|index|nasdaq|nyse|s ?p ?500|dow|rally|crash|bull(ish)?|bear(ish)?|sector|fed|inflation|rates?)\b"
+)
+TICKER_RE = re.compile(r"(?:^|\s)\$?([A-Z]{2,5}(?:\.[A-Z])?)\b")
+NOT_TICKERS = frozenset({"AI", "OK", "CEO", "CFO", "USA", "US", "UK", "EU", "IPO", "ETF", "PE", "EPS", "GDP", "FAQ"})
+
+
+class SearchClassifier:
+    """Rule-based needs_search decisions with an LRU memo of every answered question"""
+
+    def __init__(self, memo_size: int = 2048, fast_path: bool = True):
+        self.memo_size = memo_size
+        self.fast_path = fast_path
+        self._memo = OrderedDict()  # normalized question -> needs_search
+        self._lock = threading.Lock()
+        self.counts = {"fast_path": 0, "memo": 0, "llm": 0}
+
+    def classify(self, question: str, entities=None):
+        """needs_search for clear cases, None when the LLM should decide"""
+        key = normalize_question(question)
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self.counts["memo"] += 1
+                return self._memo[key]
+
+        decision = self.rule_decision(question, entities) if self.fast_path else None
+        if decision is None:
+            return None
+        with self._lock:
+            self.counts["fast_path"] += 1
+            self._remember(key, decision)
+        return decision
+
+    def peek(self, question: str, entities=None):
+        """Like classify() but without counting or memoizing - for callers outside the graph"""
+        with self._lock:
+            decision = self._memo.get(normalize_question(question))
+        if decision is None and self.fast_path:
+            decision = self.rule_decision(question, entities)
+        return decision
+
+    def record_llm(self, question: str, needs_search: bool) -> None:
+        """Memoize a decision the LLM made for a low-confidence question"""
+        with self._lock:
+            self.counts["llm"] += 1
+            self._remember(normalize_question(question), needs_search)
+
+    @staticmethod
+    def rule_decision(question: str, entities=None):
+        """entities: symbols the question mentions (SymbolIndex.extract) - a known company is a market signal"""
+        text = normalize_question(question)
+        if not text:
+            return False
+        conversational = bool(SMALL_TALK_RE.match(text) or FOLLOW_UP_RE.search(text))
+        market = bool(
+            entities
+            or MARKET_TERMS_RE.search(text)
+            or any(t not in NOT_TICKERS for t in TICKER_RE.findall(question))
+        )
+        if conversational and not market:
+            return False
+        if market and not conversational:
+            return True
+        return None
+
+    def _remember(self, key, decision):
+        self._memo[key] = decision
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = sum(self.counts.values())
+        return {
+            **self.counts,
+            "total": total,
+            "llm_rate": round(self.counts["llm"] / total, 4) if total else 0.0,
+            "memo_entries": len(self._memo),
+        }
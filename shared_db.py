@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Shared SQLite Database
+
+Conversation checkpoints and the search/answer caches can live in one SQLite
+file (STATE_DB_PATH) that every worker process opens, so any worker can
+continue any session and restarts keep them.
+
+Each component keeps one long-lived connection per process (no connect per
+request). The connection is set up for several processes writing to the same
+file:
+- WAL journal: readers never block the writer and vice versa
+- synchronous=NORMAL: commits don't wait for an fsync (WAL stays consistent)
+- busy timeout: a writer waits for another process's transaction to finish
+  instead of failing with "database is locked"
+"""
+
+import sqlite3
+
+
+def connect(path: str, busy_timeout: float = 30.0) -> sqlite3.Connection:
+    """Connection usable from any thread (callers serialize access with their own lock)"""
+    db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+    return db
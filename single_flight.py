@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Single-Flight
+
+Collapses concurrent identical async calls into one execution. The first
+caller for a key starts the work; everyone else asking for the same key while
+it is running awaits that same task and gets the same result (or exception).
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    """Per-key deduplication of in-flight coroutines"""
+
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Task
+        self.executed = 0
+        self.shared = 0
+
+    async def run(self, key, fn):
+        """Await fn() - or the already running call for the same key"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.executed += 1
+        else:
+            self.shared += 1
+        # shield - one caller giving up (timeout, disconnect) must not cancel the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved - every waiter may have given up already
+
+    def stats(self) -> dict:
+        return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._inflight)}
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Speculative Retrieval
+
+When `check` has to ask the LLM whether a question needs a search, retrieval
+is started right away instead of after the answer comes back - the prompt
+says search is needed almost always, so the classifier's round-trip is
+usually hidden behind Tavily/Wikipedia latency.
+
+- `start()` runs the retrieval nodes as background tasks for one run
+  (keyed by thread + question)
+- the graph's retrieval nodes are wrapped with `node()`: they take the
+  speculative result if there is one and only run themselves otherwise
+- `discard()` drops the speculation when the classifier says no search is
+  needed. Running tasks are left to finish rather than cancelled: the
+  upstream calls behind them are shared single-flight work that keeps going
+  anyway, and a finished web search still lands in the search cache
+
+Every speculation is counted as used or wasted for /cache/stats and /metrics.
+"""
+
+import asyncio
+import time
+
+
+def _retrieve(task) -> None:
+    if not task.cancelled():
+        task.exception()  # mark retrieved - a discarded task's error has no reader
+
+
+class Speculation:
+    """Background retrieval tasks started before the search decision is known"""
+
+    def __init__(self, enabled: bool = True, stale_after: float = 120):
+        self.enabled = enabled
+        self.stale_after = stale_after  # the run died between check and retrieval - drop its tasks
+        self._runs = {}  # key -> (started_at, {node name: asyncio.Task})
+        self.counts = {"started": 0, "used": 0, "wasted": 0}
+
+    @staticmethod
+    def key(config, question: str) -> tuple:
+        return (config or {}).get("configurable", {}).get("thread_id"), question
+
+    def start(self, key, nodes: dict) -> None:
+        """Start `nodes` (name -> zero-argument coroutine function) unless this run already has them"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        for stale in [k for k, (started_at, _) in self._runs.items() if now - started_at > self.stale_after]:
+            self.discard(stale)
+        if key in self._runs:
+            return  # same question running twice on one thread - the second run retrieves normally
+        self._runs[key] = (now, {name: asyncio.ensure_future(fn()) for name, fn in nodes.items()})
+        self.counts["started"] += len(nodes)
+
+    def discard(self, key) -> None:
+        """Search turned out to be unnecessary - nobody will read these results"""
+        _, tasks = self._runs.pop(key, (None, {}))
+        for task in tasks.values():
+            task.add_done_callback(_retrieve)
+            self.counts["wasted"] += 1
+
+    def take(self, key, name: str):
+        """The speculative task for node `name` of this run, if any"""
+        run = self._runs.get(key)
+        if run is None or name not in run[1]:
+            return None
+        task = run[1].pop(name)
+        if not run[1]:
+            del self._runs[key]
+        self.counts["used"] += 1
+        return task
+
+    def node(self, name: str, fn):
+        """Graph node that returns the speculative result for its run, or runs fn itself"""
+        async def run(state, config):
+            task = self.take(self.key(config, state["question"]), name)
+            if task is not None:
+                return await task
+            return await fn(state, config)
+        return run
+
+    def stats(self) -> dict:
+        started = self.counts["started"]
+        return {
+            **self.counts,
+            "waste_ratio": round(self.counts["wasted"] / started, 4) if started else 0.0,
+            "enabled": self.enabled,
+            "in_flight": sum(len(tasks) for _, tasks in self._runs.values()),
+        }
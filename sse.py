@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+SSE Stream Writer
+
+Turns the analysis event stream ({'type': ..., ...} dicts) into Server-Sent
+Events frames without fixed pacing sleeps:
+
+- the first content chunk is sent right away (time-to-first-token)
+- later content chunks are coalesced until `max_chars` or `max_delay` is hit
+- any other event (status, metadata, complete, error) flushes pending content
+  and goes out immediately
+- events are pulled through a bounded queue, so when the client reads slowly
+  everything already queued is merged into fewer, larger frames
+
+Frame counts and the time spent encoding are recorded in `stats()`.
+"""
+
+import asyncio
+import json
+import time
+
+
+class _ProducerFailed:
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+class SSEWriter:
+    """Coalescing SSE encoder shared by the streaming endpoints"""
+
+    def __init__(self, max_chars: int = 256, max_delay: float = 0.015, queue_size: int = 256):
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.frames = 0
+        self.content_frames = 0
+        self.content_chunks = 0
+        self.bytes_sent = 0
+        self.encode_seconds = 0.0
+
+    def encode(self, payload: dict) -> str:
+        started = time.perf_counter()
+        frame = f"data: {json.dumps(payload)}\n\n"
+        self.encode_seconds += time.perf_counter() - started
+        self.frames += 1
+        self.bytes_sent += len(frame)
+        return frame
+
+    def _content_frame(self, pieces: list) -> str:
+        self.content_frames += 1
+        return self.encode({"type": "content", "content": "".join(pieces)})
+
+    async def stream(self, events):
+        """Async iterator of SSE frames for an async iterator of event dicts"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+
+        async def produce():
+            try:
+                async for event in events:
+                    await queue.put(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await queue.put(_ProducerFailed(e))
+                return
+            await queue.put(_DONE)
+
+        producer = asyncio.create_task(produce())
+        pending, pending_chars, window_start = [], 0, 0.0
+        sent_first_content = False
+        try:
+            while True:
+                if pending:
+                    try:
+                        event = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        remaining = window_start + self.max_delay - loop.time()
+                        try:
+                            if remaining <= 0:
+                                raise asyncio.TimeoutError
+                            event = await asyncio.wait_for(queue.get(), remaining)
+                        except asyncio.TimeoutError:
+                            yield self._content_frame(pending)
+                            pending, pending_chars = [], 0
+                            continue
+                else:
+                    event = await queue.get()
+
+                if event is _DONE:
+                    break
+                if isinstance(event, _ProducerFailed):
+                    raise event.error
+
+                if event.get("type") == "content":
+                    self.content_chunks += 1
+                    if not pending:
+                        window_start = loop.time()
+                    pending.append(event["content"])
+                    pending_chars += len(event["content"])
+                    if not sent_first_content or pending_chars >= self.max_chars:
+                        sent_first_content = True
+                        yield self._content_frame(pending)
+                        pending, pending_chars = [], 0
+                    continue
+
+                if pending:
+                    yield self._content_frame(pending)
+                    pending, pending_chars = [], 0
+                yield self.encode(event)
+
+            if pending:
+                yield self._content_frame(pending)
+        finally:
+            if not producer.done():
+                producer.cancel()  # client went away - stop pulling from the graph
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "content_frames": self.content_frames,
+            "content_chunks": self.content_chunks,
+            "chunks_per_content_frame": round(self.content_chunks / self.content_frames, 2)
+            if self.content_frames else 0.0,
+            "bytes_sent": self.bytes_sent,
+            "avg_encode_us": round(self.encode_seconds / self.frames * 1e6, 2) if self.frames else 0.0,
+        }
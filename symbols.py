@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Ticker / Company Index
+
+Local entity linking for questions. A listings file (ticker, name, aliases)
+is loaded once into a word-level trie; `extract()` walks the question and
+returns the canonical tickers it mentions, longest match first:
+
+- "$aapl", "AAPL", "aapl"              -> AAPL
+- "Apple", "apple inc", "iPhone maker" -> AAPL
+- "Compare NVIDIA vs AMD"               -> NVDA, AMD
+
+Tickers match when written in capitals, in lowercase or with a leading `$`.
+Single-letter tickers and tickers that are ordinary words (NOW, LOW, ...)
+need the `$`. A lowercase ticker also has to be at least three letters and
+not a common English word ("cost", "snow", "shop" stay words).
+`canonical_question()` reduces a question to those tickers plus its remaining
+content words, so caches and request coalescing treat "AAPL price" and
+"what's the price of Apple stock?" as the same question.
+"""
+
+import csv
+import re
+
+from search_cache import normalize_question
+
+WORD_TICKERS = frozenset({"ALL", "ARE", "CAN", "CAT", "DE", "LOW", "NOW", "ON", "IT", "SO", "GO", "GE", "MA", "MS"})
+FILLER_WORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me my "
+    "of on or should the this to was what whats when which who why will with you your "
+    "about tell give show stock stocks share shares company companies corp inc ticker".split()
+)
+
+# Lowercase words that are also tickers (here or on other listings) - written like this they're just words
+COMMON_WORDS = FILLER_WORDS | frozenset(
+    "all are arm big can car cars cash cat coin cost dis eat fast fly fun gold good hon home hood key life "
+    "love low mmm net now one open pep play real run safe sap see shop snow spot spy true ups well".split()
+)
+
+_WORD_RE = re.compile(r"\$?[A-Za-z0-9&]+(?:\.[A-Za-z]+)?")
+
+
+def _words(text: str) -> list:
+    """(original, lowercase) word pairs; apostrophes dropped like normalize_question"""
+    return [(w, w.lower().lstrip("$")) for w in _WORD_RE.findall(text.replace("'", "").replace("’", ""))]
+
+
+class SymbolIndex:
+    """Word trie over tickers, company names and aliases"""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._trie = {}  # word -> child node; "" -> ticker at the end of a name/alias
+        self._tickers = {}  # TICKER -> canonical company name
+        if path:
+            self.load(path)
+
+    def load(self, path: str) -> int:
+        """Add every row of a ticker,name,aliases CSV (aliases separated by '|')"""
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        for row in rows:
+            self.add(row["ticker"], row["name"], (row.get("aliases") or "").split("|"))
+        return len(rows)
+
+    def add(self, ticker: str, name: str, aliases=()) -> None:
+        ticker = ticker.strip().upper()
+        self._tickers.setdefault(ticker, name.strip())
+        for phrase in [name, *aliases]:
+            words = [lower for _, lower in _words(phrase)]
+            if not words:
+                continue
+            node = self._trie
+            for word in words:
+                node = node.setdefault(word, {})
+            node.setdefault("", ticker)  # first listing wins for shared aliases
+
+    def _ticker_at(self, original: str):
+        symbol = original.lstrip("$").upper()
+        if symbol not in self._tickers:
+            return None
+        if original.startswith("$"):
+            return symbol
+        if original.isupper() and len(symbol) > 1 and symbol not in WORD_TICKERS:
+            return symbol
+        if original.islower() and len(symbol) > 2 and symbol not in WORD_TICKERS and original not in COMMON_WORDS:
+            return symbol
+        return None
+
+    def _matches(self, question: str):
+        """(start, end, ticker) spans over the question's words, longest match first"""
+        words = _words(question)
+        spans, i = [], 0
+        while i < len(words):
+            node, best = self._trie, None
+            for j in range(i, len(words)):
+                node = node.get(words[j][1])
+                if node is None:
+                    break
+                if "" in node:
+                    best = (j + 1, node[""])
+            if best is None:
+                ticker = self._ticker_at(words[i][0])
+                if ticker:
+                    best = (i + 1, ticker)
+            if best:
+                spans.append((i, best[0], best[1]))
+                i = best[0]
+            else:
+                i += 1
+        return words, spans
+
+    def extract(self, question: str) -> list:
+        """Canonical entities in order of mention: [{"ticker": ..., "name": ...}]"""
+        _, spans = self._matches(question)
+        entities, seen = [], set()
+        for _, _, ticker in spans:
+            if ticker not in seen:
+                seen.add(ticker)
+                entities.append({"ticker": ticker, "name": self._tickers[ticker]})
+        return entities
+
+    def canonical_question(self, question: str) -> str:
+        """Order-insensitive key: $tickers mentioned plus the remaining non-filler words"""
+        words, spans = self._matches(question)
+        if not spans:
+            return normalize_question(question)
+        tickers, rest, i = set(), set(), 0
+        for start, end, ticker in spans:
+            rest.update(lower for _, lower in words[i:start])
+            tickers.add(f"${ticker.lower()}")
+            i = end
+        rest.update(lower for _, lower in words[i:])
+        return " ".join(sorted(tickers) + sorted(rest - FILLER_WORDS))
+
+    def stats(self) -> dict:
+        return {"path": self.path, "tickers": len(self._tickers)}
@@ -0,0 +1,76 @@
+import asyncio
+import contextvars
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from history import HistoryCompactor
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class State(MessagesState):
+    question: str
+    summary: str
+
+
+def build_graph():
+    async def generate_answer(state):
+        await asyncio.sleep(0.01)
+        return {"messages": [HumanMessage(content=state["question"]), AIMessage(content="answer " * 20)]}
+
+    builder = StateGraph(State)
+    builder.add_node("generate_answer", generate_answer)
+    builder.add_edge(START, "generate_answer")
+    builder.add_edge("generate_answer", END)
+    return builder.compile(checkpointer=MemorySaver())
+
+
+def make_compactor(graph, seen):
+    async def summarize(previous_summary, messages):
+        seen.append(request_id.get())
+        await asyncio.sleep(0.05)  # the next turn runs while the summary is generated
+        return f"summary of {len(messages)} messages"
+
+    return HistoryCompactor(lambda: graph, summarize, token_budget=10, keep_messages=2)
+
+
+async def ask(graph, compactor, config, question):
+    """One turn the way the endpoints run it: under the thread's lock, compaction scheduled afterwards"""
+    request_id.set(question)
+    async with compactor.turn(config["configurable"]["thread_id"]):
+        result = await graph.ainvoke({"question": question}, config)
+    compactor.schedule(config, result["messages"])
+
+
+def test_back_to_back_turns_keep_summary_and_drop_old_messages():
+    async def run():
+        graph = build_graph()
+        compactor = make_compactor(graph, [])
+        config = {"configurable": {"thread_id": "t"}}
+        await ask(graph, compactor, config, "first")
+        await ask(graph, compactor, config, "second")  # over budget - compaction starts
+        await ask(graph, compactor, config, "third")  # runs while the summary is generated
+        await compactor.drain()
+        return (await graph.aget_state(config)).values, compactor.stats()
+
+    values, stats = asyncio.run(run())
+    assert values["summary"] == "summary of 2 messages"
+    assert [m.content for m in values["messages"] if isinstance(m, HumanMessage)] == ["second", "third"]
+    assert len(values["messages"]) == 4
+    assert stats["compactions"] == 1 and stats["messages_removed"] == 2 and stats["failures"] == 0
+
+
+def test_compaction_does_not_inherit_the_request_context():
+    async def run():
+        graph = build_graph()
+        seen = []
+        compactor = make_compactor(graph, seen)
+        config = {"configurable": {"thread_id": "t"}}
+        await ask(graph, compactor, config, "first")
+        await ask(graph, compactor, config, "second")
+        await compactor.drain()
+        return seen
+
+    assert asyncio.run(run()) == [None]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Turn-Scoped Retrieval Context
+
+The `context` channel is checkpointed per conversation thread, so a plain
+`operator.add` reducer keeps every retrieved document from every earlier question.
+`merge_context` appends like before, but the first node of a turn writes a
+reset marker (`reset_context()`) that clears the channel. Optionally a small,
+deduplicated summary of the previous context (source URL + opening snippet per
+document) is carried over, capped at `carry_over_chars`.
+"""
+
+import re
+
+CONTEXT_RESET = "__context_reset__"
+SUMMARY_TAG = "PreviousContext"
+
+_SUMMARY_LINE_RE = re.compile(r"^- (\S+): (.*)$", re.MULTILINE)
+
+
+def reset_context(carry_over_chars: int = 0) -> list:
+    """Context update that starts a new turn (keeps up to carry_over_chars of summary)"""
+    return [{CONTEXT_RESET: carry_over_chars}]
+
+
+def merge_context(existing: list, update: list) -> list:
+    """Reducer for Researchstate.context"""
+    existing = existing or []
+    if update and isinstance(update[0], dict) and CONTEXT_RESET in update[0]:
+        summary = summarize_context(existing, update[0][CONTEXT_RESET])
+        return ([summary] if summary else []) + list(update[1:])
+    return existing + list(update)
+
+
+def summarize_context(context: list, max_chars: int) -> str:
+    """Bounded one-line-per-source digest of earlier context, newest sources first"""
+    if max_chars <= 0:
+        return ""
+    entries = []
+    for item in reversed(context):
+        if isinstance(item, dict) and item.get("url"):
+            entries.append((item["url"], " ".join(item.get("content", "").split())[:200]))
+        elif isinstance(item, str) and item.startswith(f"<{SUMMARY_TAG}>"):
+            entries.extend(_SUMMARY_LINE_RE.findall(item))
+
+    lines, seen, used = [], set(), 0
+    for url, snippet in entries:
+        if url in seen:
+            continue
+        line = f"- {url}: {snippet}"
+        if used + len(line) > max_chars:
+            break
+        seen.add(url)
+        lines.append(line)
+        used += len(line) + 1
+    if not lines:
+        return ""
+    return f"<{SUMMARY_TAG}>\n" + "\n".join(lines) + f"\n</{SUMMARY_TAG}>"
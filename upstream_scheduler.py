@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Upstream Scheduler
+
+Every call to Gemini, Tavily and Wikipedia takes a token from its provider's
+bucket first (`await upstream.acquire(provider, ...)`), so bursts queue up
+locally instead of running into provider quotas and 429s.
+
+- token bucket per provider: `rate` requests/second refilled up to `burst`
+- callers that can't go right away wait in a bounded queue
+  (`UpstreamBusy` once `max_queue` are waiting)
+- waiting interactive requests always go before batch ones
+- within a priority, waiting callers are served round-robin per client
+  (session or batch), so one heavy client can't starve the others
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+INTERACTIVE = 0
+BATCH = 1
+
+
+class UpstreamBusy(Exception):
+    """Raised when the scheduler's wait queue for a provider is full"""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float = 1.0) -> float:
+        """Seconds until `cost` tokens are available (0 = now)"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        missing = min(cost, self.burst) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, cost: float = 1.0) -> None:
+        if self.rate > 0:
+            self.tokens -= min(cost, self.burst)
+
+
+class _Provider:
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.queues = {}  # priority -> OrderedDict(client -> deque of (future, cost, queued_at))
+        self.waiting = 0
+        self.dispatcher = None
+        self.counts = {"granted": 0, "queued": 0, "rejected": 0}
+        self.served_from_queue = 0
+        self.wait_seconds = 0.0
+
+
+class UpstreamScheduler:
+    """Per-provider rate limits with priority and per-client fair queuing"""
+
+    def __init__(self, limits: dict, max_queue: int = 256):
+        """limits: provider -> (requests per second, burst); a rate of 0 means unlimited"""
+        self.max_queue = max_queue
+        self._providers = {name: _Provider(rate, burst) for name, (rate, burst) in limits.items()}
+
+    async def acquire(self, provider: str, priority: int = INTERACTIVE, client: str = "", cost: float = 1.0) -> None:
+        """Wait for permission to make `cost` requests to `provider`"""
+        p = self._providers.get(provider)
+        if p is None:
+            return
+        if p.waiting == 0 and p.bucket.delay(cost) == 0:
+            p.bucket.take(cost)
+            p.counts["granted"] += 1
+            return
+        if p.waiting >= self.max_queue:
+            p.counts["rejected"] += 1
+            raise UpstreamBusy(f"{provider}: {p.waiting} requests already waiting")
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = p.queues.setdefault(priority, OrderedDict()).setdefault(client, deque())
+        waiters.append((future, cost, time.monotonic()))
+        p.waiting += 1
+        p.counts["queued"] += 1
+        if p.dispatcher is None or p.dispatcher.done():
+            p.dispatcher = asyncio.ensure_future(self._dispatch(p))
+        try:
+            await future
+        finally:
+            if not future.done():
+                future.cancel()  # caller gave up (deadline, disconnect) - the dispatcher skips it
+
+    def _next(self, p):
+        """Oldest waiter of the next client in line, highest priority first"""
+        for priority in sorted(p.queues):
+            clients = p.queues[priority]
+            while clients:
+                client, waiters = next(iter(clients.items()))
+                entry = waiters.popleft()
+                if waiters:
+                    clients.move_to_end(client)  # round-robin between clients
+                else:
+                    del clients[client]
+                p.waiting -= 1
+                if not entry[0].done():
+                    return entry
+        return None
+
+    def _peek_cost(self, p):
+        for priority in sorted(p.queues):
+            for waiters in p.queues[priority].values():
+                for future, cost, _ in waiters:
+                    if not future.done():
+                        return cost
+        return None
+
+    async def _dispatch(self, p):
+        while p.waiting:
+            cost = self._peek_cost(p)
+            if cost is None:
+                self._next(p)  # only abandoned waiters left - drain them
+                continue
+            delay = p.bucket.delay(cost)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue  # a higher-priority caller may have arrived meanwhile
+            entry = self._next(p)
+            if entry is None:
+                continue
+            future, cost, queued_at = entry
+            p.bucket.take(cost)
+            p.counts["granted"] += 1
+            p.served_from_queue += 1
+            p.wait_seconds += time.monotonic() - queued_at
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                **p.counts,
+                "waiting": p.waiting,
+                "avg_wait_ms": round(p.wait_seconds / p.served_from_queue * 1000, 2)
+                if p.served_from_queue else 0.0,
+                "rate_per_second": p.bucket.rate,
+                "burst": p.bucket.burst,
+            }
+            for name, p in self._providers.items()
+        }
+
+
+def caller(config) -> tuple:
+    """(priority, client) for the request a graph node is running for"""
+    configurable = (config or {}).get("configurable", {})
+    priority = BATCH if configurable.get("priority") == "batch" else INTERACTIVE
+    return priority, configurable.get("client_id") or configurable.get("thread_id") or ""
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Wikipedia Document Store
+
+Persistent SQLite store for Wikipedia lookups. Company articles almost never
+change, so a question we've seen before reads its background context from local
+disk instead of downloading up to six full articles again.
+
+- lookups: normalized query -> page titles returned by WikipediaLoader
+- pages:   title -> page content + metadata (+ revision id when revalidating)
+
+Entries live for a long TTL; once stale they are either reloaded or, with
+revalidation on, kept if Wikipedia still reports the same revision. Total page
+size is capped and the least recently read pages are evicted first.
+
+Revision checks are Wikipedia API calls too: get() and put() take the
+caller's blocking `acquire(cost)` and wait on it before each one, so they
+share the provider's rate limit with every other Wikipedia request.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import requests
+from langchain_core.documents import Document
+
+from search_cache import normalize_question
+
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+
+
+class WikiStore:
+    """SQLite-backed cache of WikipediaLoader results"""
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_bytes: int = 200 * 1024 * 1024,
+                 revalidate: bool = False, client=None):
+        self.path = path
+        self.client = client  # WikipediaClient for revision checks over the shared pool
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS lookups (
+                query TEXT PRIMARY KEY,
+                titles TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                title TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                revid INTEGER,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def get(self, query: str, acquire=None):
+        """Stored documents for the query, or None when missing/stale"""
+        key = normalize_question(query)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT titles, fetched_at FROM lookups WHERE query = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            titles, fetched_at = json.loads(row[0]), row[1]
+            pages = self._pages(titles)
+            if len(pages) != len(titles):  # some pages were evicted
+                self.misses += 1
+                return None
+
+        if fetched_at + self.ttl <= now:
+            if not (self.revalidate and self._unchanged(pages, acquire)):
+                with self._lock:
+                    self.misses += 1
+                return None
+            with self._lock:
+                self._db.execute("UPDATE lookups SET fetched_at = ? WHERE query = ?", (now, key))
+                self._db.executemany(
+                    "UPDATE pages SET fetched_at = ? WHERE title = ?", [(now, p["title"]) for p in pages]
+                )
+                self._db.commit()
+                self.revalidated += 1
+
+        with self._lock:
+            self._db.executemany(
+                "UPDATE pages SET accessed_at = ? WHERE title = ?", [(now, p["title"]) for p in pages]
+            )
+            self._db.commit()
+            self.hits += 1
+        return [Document(page_content=p["content"], metadata=p["metadata"]) for p in pages]
+
+    def put(self, query: str, docs, acquire=None) -> None:
+        """Store the documents returned by WikipediaLoader for a query"""
+        now = time.time()
+        titles = [doc.metadata.get("title") or doc.metadata["source"] for doc in docs]
+        revids = {title: doc.metadata.get("revision_id") for title, doc in zip(titles, docs)}
+        if self.revalidate and None in revids.values():
+            try:
+                revids = self._fetch_revids(titles, acquire)
+            except Exception:
+                pass  # stored without revision ids - reloaded in full once stale
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO pages (title, content, metadata, size, revid, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (title, doc.page_content, json.dumps(doc.metadata), len(doc.page_content.encode("utf-8")),
+                     revids.get(title), now, now)
+                    for title, doc in zip(titles, docs)
+                ],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO lookups (query, titles, fetched_at) VALUES (?, ?, ?)",
+                (normalize_question(query), json.dumps(titles), now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _pages(self, titles):
+        if not titles:
+            return []
+        placeholders = ",".join("?" * len(titles))
+        rows = self._db.execute(
+            f"SELECT title, content, metadata, revid FROM pages WHERE title IN ({placeholders})", titles
+        ).fetchall()
+        by_title = {r[0]: {"title": r[0], "content": r[1], "metadata": json.loads(r[2]), "revid": r[3]} for r in rows}
+        return [by_title[t] for t in titles if t in by_title]
+
+    def _evict(self):
+        """Drop least recently read pages until the store fits in max_bytes"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for title, size in self._db.execute("SELECT title, size FROM pages ORDER BY accessed_at").fetchall():
+            self._db.execute("DELETE FROM pages WHERE title = ?", (title,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _unchanged(self, pages, acquire=None) -> bool:
+        """Conditional revalidation - True if every page still has the stored revision"""
+        if any(p["revid"] is None for p in pages):
+            return False
+        try:
+            current = self._fetch_revids([p["title"] for p in pages], acquire)
+        except Exception:
+            return False
+        return all(current.get(p["title"]) == p["revid"] for p in pages)
+
+    def _fetch_revids(self, titles, acquire=None) -> dict:
+        """Latest revision id per title, one batched API call"""
+        if not titles:
+            return {}
+        if acquire is not None:
+            acquire(1)
+        if self.client is not None:
+            return self.client.revisions(titles)
+        response = requests.get(
+            WIKIPEDIA_API_URL,
+            params={"action": "query", "prop": "info", "titles": "|".join(titles), "format": "json"},
+            timeout=5,
+        )
+        response.raise_for_status()
+        pages = response.json().get("query", {}).get("pages", {})
+        return {p["title"]: p.get("lastrevid") for p in pages.values() if "lastrevid" in p}
+
+    def lookup_stats(self) -> dict:
+        """Hit/miss counters only (no database query)"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            pages, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {**self.lookup_stats(), "pages": pages, "bytes": size}